@@ -1,20 +1,23 @@
 from __future__ import annotations
 
 import argparse
-import json
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
 
-from .hafas_gate import HafasConfig, HafasGate
-from .poll import run_poll
-from .report import run_report
-from .subscribe import run_subscribe
-from .io import copy_file, redact_data
+from .io import copy_file, read_json, redact_data
 from .notification_log import convert_notification_log_export, parse_package_filter
 
+if TYPE_CHECKING:
+    from .hafas_gate import HafasGate
+
+# Subcommands that talk to the HAFAS gate (and therefore need credentials).
+_HAFAS_COMMANDS = frozenset({"subscribe", "poll", "search"})
+
+
+def _build_hafas(args: argparse.Namespace) -> "HafasGate":
+    from .hafas_gate import HafasConfig, HafasGate
 
-def _build_hafas(args: argparse.Namespace) -> HafasGate:
     config = HafasConfig(
         base_url=args.base_url,
         aid=args.aid,
@@ -53,16 +56,15 @@ def _add_hafas_args(parser: argparse.ArgumentParser) -> None:
     parser.add_argument("--timeout-sec", type=int, default=30)
 
 
-def main() -> None:
-    parser = argparse.ArgumentParser(prog="campaign")
-    subparsers = parser.add_subparsers(dest="command", required=True)
-
+def _add_subscribe_parser(subparsers: argparse._SubParsersAction) -> None:
     subscribe_parser = subparsers.add_parser("subscribe", help="Create subscriptions")
     subscribe_parser.add_argument("--scenario", required=True, type=Path)
     subscribe_parser.add_argument("--out-root", required=True, type=Path)
     subscribe_parser.add_argument("--no-save-logs", action="store_true")
     _add_hafas_args(subscribe_parser)
 
+
+def _add_poll_parser(subparsers: argparse._SubParsersAction) -> None:
     poll_parser = subparsers.add_parser("poll", help="Poll subscriptions for rtEvents")
     poll_parser.add_argument("--run-dir", required=True, type=Path)
     poll_parser.add_argument("--poll-sec", type=int, default=None)
@@ -72,6 +74,12 @@ def main() -> None:
     poll_parser.add_argument("--max-minutes", type=int, default=0)
     poll_parser.add_argument("--include-raw", action="store_true")
     poll_parser.add_argument("--no-save-logs", action="store_true")
+    poll_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Max HAFAS polls in flight when several subscriptions are due together",
+    )
     poll_parser.add_argument(
         "--verbose",
         action="store_true",
@@ -79,10 +87,14 @@ def main() -> None:
     )
     _add_hafas_args(poll_parser)
 
+
+def _add_sync_parser(subparsers: argparse._SubParsersAction) -> None:
     sync_parser = subparsers.add_parser("sync-device-notifs", help="Copy device NDJSON into run folder")
     sync_parser.add_argument("--run-dir", required=True, type=Path)
     sync_parser.add_argument("--device-ndjson", required=True, type=Path)
 
+
+def _add_import_log_parser(subparsers: argparse._SubParsersAction) -> None:
     import_log_parser = subparsers.add_parser(
         "import-notification-log",
         help="Convert Notification Log export JSON into device NDJSON",
@@ -93,7 +105,10 @@ def main() -> None:
     import_log_parser.add_argument("--append", action="store_true")
     import_log_parser.add_argument("--include-removed", action="store_true")
     import_log_parser.add_argument("--packages", default="")
+    import_log_parser.add_argument("--include-raw", action="store_true")
 
+
+def _add_report_parser(subparsers: argparse._SubParsersAction) -> None:
     report_parser = subparsers.add_parser("report", help="Generate report")
     report_parser.add_argument("--run-dir", required=True, type=Path)
     report_parser.add_argument("--device-ndjson", type=Path, default=None)
@@ -101,12 +116,54 @@ def main() -> None:
     report_parser.add_argument("--match-threshold", type=float, default=70.0)
     report_parser.add_argument("--no-markdown", action="store_true")
 
+
+def _add_search_parser(subparsers: argparse._SubParsersAction) -> None:
     search_parser = subparsers.add_parser("search", help="List active subscriptions")
     _add_hafas_args(search_parser)
 
-    args = parser.parse_args()
 
-    if args.client_id.upper().startswith("ANDROID-"):
+# Ordered so that the full parser lists subcommands in the historical order.
+_SUBPARSER_BUILDERS: Dict[str, Callable[[argparse._SubParsersAction], None]] = {
+    "subscribe": _add_subscribe_parser,
+    "poll": _add_poll_parser,
+    "sync-device-notifs": _add_sync_parser,
+    "import-notification-log": _add_import_log_parser,
+    "report": _add_report_parser,
+    "search": _add_search_parser,
+}
+
+
+def _sniff_subcommand(argv: List[str]) -> Optional[str]:
+    """Return the first token of argv naming a known subcommand, if any."""
+    for token in argv:
+        if token in _SUBPARSER_BUILDERS:
+            return token
+    return None
+
+
+def build_parser(command: Optional[str] = None) -> argparse.ArgumentParser:
+    """Build the CLI parser.
+
+    When ``command`` is given only that subparser is constructed; otherwise all
+    subparsers are built so that top-level ``--help`` and error messages stay complete.
+    """
+    parser = argparse.ArgumentParser(prog="campaign")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    if command is not None:
+        _SUBPARSER_BUILDERS[command](subparsers)
+    else:
+        for builder in _SUBPARSER_BUILDERS.values():
+            builder(subparsers)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = build_parser(_sniff_subcommand(argv))
+    args = parser.parse_args(argv)
+
+    if args.command in _HAFAS_COMMANDS and args.client_id.upper().startswith("ANDROID-"):
         print(
             "Warning: --client-id looks like a push channel id. Use --channel-id for "
             "ANDROID-xxxx and --client-id for the HAFAS/CFL client enum.",
@@ -114,20 +171,23 @@ def main() -> None:
         )
 
     if args.command == "subscribe":
-        hafas = _build_hafas(args)
-        run_dir = run_subscribe(
-            scenario_path=args.scenario,
-            out_root=args.out_root,
-            hafas=hafas,
-            save_logs=not args.no_save_logs,
-        )
+        from .subscribe import run_subscribe
+
+        with _build_hafas(args) as hafas:
+            run_dir = run_subscribe(
+                scenario_path=args.scenario,
+                out_root=args.out_root,
+                hafas=hafas,
+                save_logs=not args.no_save_logs,
+            )
         print(run_dir)
         return
 
     if args.command == "poll":
+        from .poll import run_poll
+
         hafas = _build_hafas(args)
-        scenario = (args.run_dir / "scenario.json").read_text(encoding="utf-8")
-        scenario_data = json.loads(scenario)
+        scenario_data = read_json(args.run_dir / "scenario.json")
         poll_sec = args.poll_sec or scenario_data.get("pollSec", 120)
         pre_window_min = args.pre_window_min or scenario_data.get("preWindowMin", 10)
         post_window_min = args.post_window_min or scenario_data.get("postWindowMin", 30)
@@ -137,18 +197,20 @@ def main() -> None:
             else scenario_data.get("idleGraceMin", 15)
         )
         max_runtime_min = args.max_minutes or scenario_data.get("maxRuntimeMin", 0)
-        run_poll(
-            run_dir=args.run_dir,
-            hafas=hafas,
-            poll_sec=poll_sec,
-            pre_window_min=pre_window_min,
-            post_window_min=post_window_min,
-            idle_grace_min=idle_grace_min,
-            max_runtime_min=max_runtime_min,
-            include_raw=args.include_raw,
-            save_logs=not args.no_save_logs,
-            verbose=args.verbose,
-        )
+        with hafas:
+            run_poll(
+                run_dir=args.run_dir,
+                hafas=hafas,
+                poll_sec=poll_sec,
+                pre_window_min=pre_window_min,
+                post_window_min=post_window_min,
+                idle_grace_min=idle_grace_min,
+                max_runtime_min=max_runtime_min,
+                include_raw=args.include_raw,
+                save_logs=not args.no_save_logs,
+                verbose=args.verbose,
+                max_workers=args.concurrency,
+            )
         return
 
     if args.command == "sync-device-notifs":
@@ -170,11 +232,14 @@ def main() -> None:
             append=args.append,
             include_removed=args.include_removed,
             packages=packages,
+            include_raw=args.include_raw,
         )
         print(f"OK: wrote {written} NDJSON lines -> {out_ndjson}")
         return
 
     if args.command == "report":
+        from .report import run_report
+
         report_dir = run_report(
             run_dir=args.run_dir,
             device_ndjson=args.device_ndjson,
@@ -186,8 +251,8 @@ def main() -> None:
         return
 
     if args.command == "search":
-        hafas = _build_hafas(args)
-        response, corr_id, _ = hafas.subscr_search()
+        with _build_hafas(args) as hafas:
+            response, corr_id, _ = hafas.subscr_search()
         secrets = {
             hafas.config.aid: "<AID>",
             hafas.config.user_id: "<USER_ID>",
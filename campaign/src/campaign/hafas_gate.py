@@ -1,10 +1,22 @@
 from __future__ import annotations
 
+import itertools
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .io import json_dumps
+
+
+# Correlation ids: one random per-process prefix plus a counter. Unique across runs
+# without hitting the OS RNG on every request (next() on a count is atomic under the GIL).
+_CORR_PREFIX = uuid.uuid4().hex
+_CORR_SEQ = itertools.count(1)
 
 
 @dataclass
@@ -20,15 +32,47 @@ class HafasConfig:
     hci_client_version: int = 1000680
     hci_version: str = "1.72"
     timeout_sec: int = 30
+    pool_maxsize: int = 10
+    connect_retries: int = 2
 
 
 class HafasGate:
+    """Thin client for the HAFAS /gate endpoint.
+
+    Safe to share between threads: requests only reads the session and its
+    connection pool is thread-safe, the config is never mutated, and correlation ids
+    come from an atomic counter. At most ``config.pool_maxsize`` calls run at once
+    without waiting for a free connection.
+    """
+
     def __init__(self, config: HafasConfig) -> None:
         self.config = config
         self.session = requests.Session()
+        # All calls hit the same /gate host: keep one pool of reusable keep-alive
+        # connections and only retry failures that happen before the request is sent
+        # (POSTs such as SubscrCreate are not idempotent).
+        retry = Retry(
+            total=config.connect_retries,
+            connect=config.connect_retries,
+            read=0,
+            status=0,
+            backoff_factor=0.5,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.pool_maxsize, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "HafasGate":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
 
     def _post(self, method: str, req: Dict[str, Any]) -> Tuple[Dict[str, Any], str, Dict[str, Any]]:
-        corr_id = str(uuid.uuid4())
+        corr_id = f"{_CORR_PREFIX}-{next(_CORR_SEQ)}"
         params = {
             "aid": self.config.aid,
             "hciClientType": self.config.hci_client_type,
@@ -57,11 +101,11 @@ class HafasGate:
                 }
             ],
         }
-        headers = {"X-Correlation-ID": corr_id}
+        headers = {"X-Correlation-ID": corr_id, "Content-Type": "application/json"}
         response = self.session.post(
             self.config.base_url,
             params=params,
-            json=payload,
+            data=json_dumps(payload),
             headers=headers,
             timeout=self.config.timeout_sec,
         )
@@ -90,6 +134,25 @@ class HafasGate:
         }
         return self._post("SubscrCreate", req)
 
+    def subscr_create_con_many(
+        self,
+        items: Iterable[Dict[str, Any]],
+        max_workers: int = 8,
+    ) -> Iterator[Tuple[Dict[str, Any], str, Dict[str, Any]] | Exception]:
+        """Create subscriptions concurrently, yielding one outcome per item in input order.
+
+        A failed item yields its exception instead of raising: later items may already be
+        created server-side, and the caller must still get their responses.
+        """
+        workers = max(1, min(max_workers, self.config.pool_maxsize))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.subscr_create_con, item) for item in items]
+            for future in futures:
+                try:
+                    yield future.result()
+                except Exception as exc:
+                    yield exc
+
     def subscr_details(self, subscr_id: int) -> Tuple[Dict[str, Any], str, Dict[str, Any]]:
         req = {
             "subscrId": subscr_id,
@@ -2,11 +2,47 @@ from __future__ import annotations
 
 import json
 import os
+import re
 import shutil
-from dataclasses import asdict
+import time
+from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def json_dumps(data: Any, *, indent: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes (orjson when available, stdlib json otherwise).
+
+    The backends agree on compact strings, ints, bools, null and containers but not on
+    floats: orjson writes 0.00001 and 1e20 where json writes 1e-05 and 1e+20, and NaN or
+    Infinity as null. Nothing that is hashed or compared across runs may rely on these
+    bytes. Data orjson rejects, such as ints wider than 64 bits, goes through stdlib json.
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        try:
+            return orjson.dumps(data, option=option)
+        except TypeError:
+            pass  # stdlib json raises for data that really is not serializable
+    return json.dumps(
+        data,
+        indent=2 if indent else None,
+        separators=None if indent else (",", ":"),
+        ensure_ascii=False,
+    ).encode("utf-8")
+
+
+def json_loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def utc_now_iso() -> str:
@@ -17,6 +53,13 @@ def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
+def list_subdirs(path: Path) -> List[Path]:
+    """Child directories of path, sorted by name."""
+    # DirEntry.is_dir() reuses the type from the directory listing: no stat per entry.
+    with os.scandir(path) as entries:
+        return sorted(Path(entry.path) for entry in entries if entry.is_dir())
+
+
 def timestamped_run_dir(out_root: Path, campaign_name: str) -> Path:
     stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     safe_name = campaign_name.replace(" ", "_")
@@ -26,55 +69,309 @@ def timestamped_run_dir(out_root: Path, campaign_name: str) -> Path:
 
 
 def read_json(path: Path) -> Dict[str, Any]:
-    return json.loads(path.read_text(encoding="utf-8"))
+    return json_loads(path.read_bytes())
+
+
+def write_json(path: Path, data: Any, *, pretty: bool = False) -> None:
+    """Write JSON atomically; only files read by humans should pass ``pretty=True``.
+
+    The payload goes to a sibling temp file which then replaces ``path``, so readers
+    and crashes never observe a truncated file.
+    """
+    _write_bytes_atomic(path, json_dumps(data, indent=pretty))
+
 
+# writev() accepts at most IOV_MAX buffers per call (1024 on Linux and macOS).
+_IOV_MAX = 1024
+_APPEND_FLAGS = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+_TRUNC_FLAGS = os.O_WRONLY | os.O_TRUNC | os.O_CREAT | getattr(os, "O_BINARY", 0)
 
-def write_json(path: Path, data: Any) -> None:
+
+def _write_bytes_atomic(path: Path, blob: bytes) -> None:
     ensure_dir(path.parent)
-    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    tmp_path = path.with_name(path.name + ".tmp")
+    # A bare fd and one write: no file object or buffer for a payload that is already bytes.
+    fd = os.open(tmp_path, _TRUNC_FLAGS, 0o666)
+    try:
+        view = memoryview(blob)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+
+
+def _ndjson_blob(rows: Iterable[Dict[str, Any]]) -> bytes:
+    """All rows as NDJSON bytes (empty for no rows), joined without a copy per line."""
+    lines = [json_dumps(row) for row in rows]
+    if not lines:
+        return b""
+    lines.append(b"")
+    return b"\n".join(lines)
 
 
 def append_ndjson(path: Path, rows: Iterable[Dict[str, Any]]) -> None:
+    blob = _ndjson_blob(rows)
+    if not blob:
+        return
     ensure_dir(path.parent)
-    with path.open("a", encoding="utf-8") as handle:
-        for row in rows:
-            handle.write(json.dumps(row, ensure_ascii=False))
-            handle.write("\n")
+    # Serialize everything first so the file sees a single write() per call.
+    with path.open("ab") as handle:
+        handle.write(blob)
 
 
-def read_ndjson(path: Path) -> List[Dict[str, Any]]:
+def _write_chunks(fd: int, chunks: List[bytes]) -> None:
+    """Write ``chunks`` in order with one writev() per IOV_MAX chunks (write() if unavailable).
+
+    Written data is removed from ``chunks`` as it goes: if a write raises, the list holds
+    exactly the bytes that did not reach the file.
+    """
+    while chunks:
+        batch = chunks[:_IOV_MAX]
+        if hasattr(os, "writev"):
+            written = os.writev(fd, batch)
+        else:  # pragma: no cover - Windows
+            written = os.write(fd, batch[0])
+        done = 0
+        for chunk in batch:
+            if written < len(chunk):
+                break
+            written -= len(chunk)
+            done += 1
+        del chunks[:done]
+        if written:
+            chunks[0] = chunks[0][written:]
+
+
+class NdjsonWriter:
+    """Append NDJSON rows to many files through long-lived append descriptors.
+
+    Unlike ``append_ndjson``, a file is opened once and kept open until ``close()``.
+    Serialized rows are queued per file and handed to the kernel by ``flush()`` as a
+    single gathered ``writev()``, so a batch of polls costs one syscall per file
+    instead of one copy into a buffer plus a write.
+    Rows only reach the files on ``flush()``/``close()`` (or once ``buffer_size``
+    bytes are queued for a file); ``maybe_flush()`` bounds how long they wait to
+    ``flush_interval`` seconds.
+    A failed write leaves the unwritten rows queued for the next flush. Without
+    ``on_error`` the OSError propagates; with it, each file's error is reported there
+    and the other files are still flushed.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = 1 << 17,
+        flush_interval: float = 0.0,
+        on_error: Optional[Callable[[Path, OSError], None]] = None,
+    ) -> None:
+        self._buffer_size = buffer_size
+        self._flush_interval = flush_interval
+        self._on_error = on_error
+        self._last_flush = time.monotonic()
+        self._fds: Dict[Path, int] = {}
+        self._pending: Dict[Path, List[bytes]] = {}
+        self._pending_size: Dict[Path, int] = {}
+
+    def write(self, path: Path, rows: Iterable[Dict[str, Any]]) -> None:
+        blob = _ndjson_blob(rows)
+        if not blob:
+            return
+        if path not in self._pending:
+            self._pending[path] = []
+            self._pending_size[path] = 0
+        self._pending[path].append(blob)
+        self._pending_size[path] += len(blob)
+        if self._pending_size[path] >= self._buffer_size:
+            self._flush_path(path)
+
+    def _flush_path(self, path: Path) -> None:
+        chunks = self._pending[path]
+        if not chunks:
+            return
+        try:
+            fd = self._fds.get(path)
+            if fd is None:
+                ensure_dir(path.parent)
+                fd = self._fds[path] = os.open(path, _APPEND_FLAGS, 0o666)
+            _write_chunks(fd, chunks)
+        except OSError as exc:
+            if self._on_error is None:
+                raise
+            self._on_error(path, exc)
+        finally:
+            self._pending_size[path] = sum(map(len, chunks))
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        for path in self._pending:
+            self._flush_path(path)
+
+    def maybe_flush(self, until: Optional[float] = None) -> None:
+        """Flush once ``flush_interval`` has elapsed, or will have by ``until`` (monotonic).
+
+        Callers about to go idle pass their wake-up time so rows never wait out a sleep.
+        """
+        deadline = self._last_flush + self._flush_interval
+        if time.monotonic() >= deadline or (until is not None and until >= deadline):
+            self.flush()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            fds, self._fds = self._fds, {}
+            self._pending, self._pending_size = {}, {}
+            for fd in fds.values():
+                os.close(fd)
+
+    def __enter__(self) -> "NdjsonWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def iter_ndjson(path: Path) -> Iterator[Dict[str, Any]]:
     if not path.exists():
-        return []
-    rows: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as handle:
+        return
+    with path.open("rb") as handle:
         for line in handle:
             line = line.strip()
             if not line:
                 continue
-            rows.append(json.loads(line))
-    return rows
+            yield json_loads(line)
+
+
+def read_ndjson(path: Path) -> List[Dict[str, Any]]:
+    return list(iter_ndjson(path))
+
 
+_Redactor = Callable[[str], str]
 
-def _redact_value(value: Any, secrets: Dict[str, str]) -> Any:
+
+def _active_secrets(secrets: Dict[str, str]) -> Dict[str, str]:
+    return {secret: replacement for secret, replacement in secrets.items() if secret}
+
+
+def _build_redactor(table: Dict[str, str]) -> _Redactor:
+    # Longest secrets first so that a secret containing another one wins the alternation.
+    pattern = re.compile("|".join(re.escape(secret) for secret in sorted(table, key=len, reverse=True)))
+    return lambda value: pattern.sub(lambda match: table[match.group(0)], value)
+
+
+def _redact_value(value: Any, redact: _Redactor) -> Any:
     if isinstance(value, str):
-        for secret, replacement in secrets.items():
-            if secret and secret in value:
-                value = value.replace(secret, replacement)
-        return value
+        return redact(value)
     if isinstance(value, list):
-        return [_redact_value(item, secrets) for item in value]
+        return [_redact_value(item, redact) for item in value]
     if isinstance(value, dict):
-        return {key: _redact_value(val, secrets) for key, val in value.items()}
+        # Keys too: a secret used as an object key is as much of a leak as one in a value.
+        return {
+            redact(key) if isinstance(key, str) else key: _redact_value(val, redact) for key, val in value.items()
+        }
     return value
 
 
+# Characters that may appear in JSON outside of string literals (numbers, true/false/null,
+# separators, whitespace). A secret made only of these could match non-string bytes.
+_JSON_BARE_CHARS = frozenset("0123456789+-.eEtruefalsn,:[]{} \t\r\n")
+
+
 def write_json_redacted(path: Path, data: Any, secrets: Dict[str, str]) -> None:
-    redacted = _redact_value(data, secrets)
-    write_json(path, redacted)
+    """Write ``data`` as JSON with every occurrence of a secret replaced."""
+    _write_bytes_atomic(path, redacted_json_dumps(data, secrets))
+
+
+def redacted_json_dumps(data: Any, secrets: Dict[str, str]) -> bytes:
+    """Compact JSON bytes of ``data`` with every occurrence of a secret replaced.
+
+    Secrets are replaced in every string, object keys included, exactly as
+    :func:`redact_data` does. Redaction runs on the serialized bytes: a secret's
+    JSON-escaped form can only occur inside string literals, so replacing it there, at
+    character boundaries, matches redacting the decoded strings without copying the tree
+    or serializing twice. Secrets that could also match numbers or literals fall back to
+    the tree walk.
+    """
+    table = _active_secrets(secrets)
+    blob = json_dumps(data)
+    needles = _byte_needles(tuple(table.items()))
+    # Most responses contain no secret at all; only those that do are touched.
+    found = [needle for needle in needles.escaped if needle in blob]
+    if not found:
+        return blob
+    if not needles.strings_only.issuperset(found):
+        return json_dumps(_redact_value(data, _build_redactor(table)))
+    # One leftmost, longest-secret-first pass, as _build_redactor does on decoded strings.
+    parts: List[bytes] = []
+    copied = pos = 0
+    while True:
+        match = needles.pattern.search(blob, pos)
+        if match is None:
+            break
+        start = match.start()
+        if _inside_escape(blob, start):
+            # e.g. secret "nab" in "x\nab": the "n" belongs to the escape, not the text.
+            pos = start + 1
+            continue
+        parts += (blob[copied:start], needles.replacements[match.group()])
+        copied = pos = match.end()
+    if not parts:
+        return blob
+    parts.append(blob[copied:])
+    return b"".join(parts)
+
+
+def _inside_escape(blob: bytes, pos: int) -> bool:
+    """Whether ``pos`` falls after the backslash of a JSON escape (``\\n``, ``\\u001f``...)."""
+    # The nearest backslash decides; escapes are at most six bytes long.
+    start = blob.rfind(b"\\", max(pos - 5, 0), pos)
+    if start < 0:
+        return False
+    run = 1
+    while start - run >= 0 and blob[start - run] == 0x5C:
+        run += 1
+    if run % 2 == 0:
+        # Second half of an escaped backslash: pos is past that escape.
+        return False
+    # blob[start] opens an escape: two bytes long, or six for \uXXXX.
+    return start == pos - 1 or blob[start + 1] == 0x75
+
+
+@dataclass(frozen=True, slots=True)
+class _ByteNeedles:
+    escaped: Tuple[bytes, ...]
+    strings_only: FrozenSet[bytes]
+    replacements: Dict[bytes, bytes]
+    pattern: "re.Pattern[bytes]"
+
+
+@lru_cache(maxsize=8)
+def _byte_needles(items: Tuple[Tuple[str, str], ...]) -> _ByteNeedles:
+    """JSON-escaped secrets with their escaped replacements and one alternation of them.
+
+    A run redacts every payload with the same secrets, so the escaping is done once.
+    Longest secrets come first so that a secret containing another one wins.
+    ``strings_only`` holds the secrets that cannot match outside string literals.
+    """
+    pairs = [
+        (json_dumps(secret)[1:-1], json_dumps(replacement)[1:-1], secret)
+        for secret, replacement in sorted(items, key=lambda item: len(item[0]), reverse=True)
+    ]
+    escaped = tuple(needle for needle, _, _ in pairs)
+    return _ByteNeedles(
+        escaped=escaped,
+        strings_only=frozenset(needle for needle, _, secret in pairs if not _JSON_BARE_CHARS.issuperset(secret)),
+        replacements={needle: replacement for needle, replacement, _ in pairs},
+        pattern=re.compile(b"|".join(map(re.escape, escaped))),
+    )
 
 
 def redact_data(data: Any, secrets: Dict[str, str]) -> Any:
-    return _redact_value(data, secrets)
+    """Copy of ``data`` with every secret replaced in its strings and string object keys."""
+    table = _active_secrets(secrets)
+    if not table:
+        return data
+    return _redact_value(data, _build_redactor(table))
 
 
 def copy_file(src: Path, dest: Path) -> None:
@@ -82,11 +379,30 @@ def copy_file(src: Path, dest: Path) -> None:
     shutil.copy2(src, dest)
 
 
+def _state_log_path(path: Path) -> Path:
+    return path.with_suffix(".log")
+
+
+def read_state(path: Path) -> Dict[str, Any]:
+    """Load the state snapshot and replay the deltas appended to its log since."""
+    state: Dict[str, Any] = read_json(path) if path.exists() else {}
+    log_path = _state_log_path(path)
+    if not log_path.exists():
+        return state
+    with log_path.open("rb") as handle:
+        for line in handle:
+            try:
+                state.update(json_loads(line))
+            except ValueError:
+                # Line torn by a crash mid-append (later appends may share it): skip just that one.
+                continue
+    return state
+
+
 def ensure_state(path: Path) -> Dict[str, Any]:
-    if path.exists():
-        return read_json(path)
+    if path.exists() or _state_log_path(path).exists():
+        return read_state(path)
     state = {
-        "seenKeys": [],
         "lastPollUtc": None,
         "pollCount": 2,
         "lastActivityUtc": None,
@@ -97,41 +413,85 @@ def ensure_state(path: Path) -> Dict[str, Any]:
     return state
 
 
+_STATE_DEFAULTS: Dict[str, Any] = {
+    "pollCount": 0,
+    "lastActivityUtc": None,
+    "plannedEndUtc": None,
+    "done": False,
+}
+
+
+def _state_fields(
+    poll_count: int | None,
+    last_activity_utc: str | None,
+    planned_end_utc: str | None,
+    done: bool | None,
+    extra_fields: Dict[str, Any] | None,
+) -> Dict[str, Any]:
+    fields: Dict[str, Any] = {"lastPollUtc": utc_now_iso()}
+    # None means "unchanged": never overwrite a stored value with it.
+    if poll_count is not None:
+        fields["pollCount"] = poll_count
+    if last_activity_utc is not None:
+        fields["lastActivityUtc"] = last_activity_utc
+    if planned_end_utc is not None:
+        fields["plannedEndUtc"] = planned_end_utc
+    if done is not None:
+        fields["done"] = done
+    if extra_fields:
+        fields.update(extra_fields)
+    return fields
+
+
 def update_state(
     path: Path,
-    seen_keys: Iterable[str],
     poll_count: int | None = None,
     last_activity_utc: str | None = None,
     planned_end_utc: str | None = None,
     done: bool | None = None,
     extra_fields: Dict[str, Any] | None = None,
-) -> None:
-    state: Dict[str, Any] = {}
-    if path.exists():
-        state = read_json(path)
-    state.update(
-        {
-            "seenKeys": sorted(set(seen_keys)),
-            "lastPollUtc": utc_now_iso(),
-        }
-    )
-    # pollCount: do not overwrite with None
-    if poll_count is not None:
-        state["pollCount"] = poll_count
-    elif "pollCount" not in state:
-        state["pollCount"] = 0
-    if last_activity_utc is not None:
-        state["lastActivityUtc"] = last_activity_utc
-    elif "lastActivityUtc" not in state:
-        state["lastActivityUtc"] = None
-    if planned_end_utc is not None:
-        state["plannedEndUtc"] = planned_end_utc
-    elif "plannedEndUtc" not in state:
-        state["plannedEndUtc"] = None
-    if done is not None:
-        state["done"] = done
-    elif "done" not in state:
-        state["done"] = False
-    if extra_fields:
-        state.update(extra_fields)
+    current: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """Merge poll progress into the state file and fold in (then drop) its delta log.
+
+    ``current`` is the caller's up-to-date copy of the state (snapshot plus deltas) and
+    saves re-reading it from disk. Returns the state as written.
+
+    Seen event keys are not part of the state: they live in the ``seen_keys.ndjson``
+    sidecar, so a legacy ``seenKeys`` list is dropped here once it has been migrated.
+    """
+    state = dict(current) if current is not None else read_state(path)
+    state.pop("seenKeys", None)
+    for key, default in _STATE_DEFAULTS.items():
+        state.setdefault(key, default)
+    state.update(_state_fields(poll_count, last_activity_utc, planned_end_utc, done, extra_fields))
     write_json(path, state)
+    _state_log_path(path).unlink(missing_ok=True)
+    return state
+
+
+def append_state_delta(
+    path: Path,
+    poll_count: int | None = None,
+    last_activity_utc: str | None = None,
+    planned_end_utc: str | None = None,
+    done: bool | None = None,
+    extra_fields: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    """Record one poll's progress as a line in the state log instead of rewriting the snapshot.
+
+    ``read_state`` replays these lines; ``update_state``/``compact_state`` fold them back in.
+    Returns the delta so callers holding the state in memory can apply it too.
+    """
+    delta = _state_fields(poll_count, last_activity_utc, planned_end_utc, done, extra_fields)
+    append_ndjson(_state_log_path(path), [delta])
+    return delta
+
+
+def compact_state(path: Path) -> None:
+    """Rewrite the state snapshot with its pending log folded in, then drop the log."""
+    log_path = _state_log_path(path)
+    if not log_path.exists():
+        return
+    write_json(path, read_state(path))
+    log_path.unlink()
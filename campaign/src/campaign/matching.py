@@ -1,27 +1,48 @@
 from __future__ import annotations
 
+from bisect import bisect_left, bisect_right
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from dateutil import parser as dt_parser
-
 try:
-    from rapidfuzz import fuzz
+    from rapidfuzz import fuzz, process
 except ImportError:  # pragma: no cover
     fuzz = None
+    process = None
+
+
+# Keywords shared by event and notification texts add a small bonus to the score.
+_KEYWORDS = ("delay", "cancel", "platform", "track", "suppressed")
+
+
+def _isoparse(value: str) -> datetime:
+    """dateutil's lenient ISO parser; only imported once the C parser has rejected a value."""
+    from dateutil import parser as dt_parser
+
+    return dt_parser.isoparse(value)
 
 
 def _parse_dt(value: str | None) -> Optional[datetime]:
-    if not value:
+    if not value or not isinstance(value, str):
         return None
+    return _parse_dt_cached(value)
+
+
+@lru_cache(maxsize=4096)
+def _parse_dt_cached(value: str) -> Optional[datetime]:
     try:
-        parsed = dt_parser.isoparse(value)
-        if parsed.tzinfo is None:
-            return parsed.replace(tzinfo=timezone.utc)
-        return parsed
-    except (ValueError, TypeError):
-        return None
+        # Fast path: the C parser handles the canonical forms we emit (incl. trailing "Z").
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = _isoparse(value)
+        except (ValueError, TypeError):
+            return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed
 
 
 def similarity(a: str | None, b: str | None) -> float:
@@ -34,6 +55,20 @@ def similarity(a: str | None, b: str | None) -> float:
     return _fallback_similarity(a, b)
 
 
+def similarity_many(query: str | None, choices: List[str]) -> List[float]:
+    """Score ``query`` against already-stripped ``choices``, like :func:`similarity` per pair."""
+    query = (query or "").strip()
+    if not query:
+        return [0.0] * len(choices)
+    if fuzz:
+        # One scorer setup for the query instead of one Python->C round trip per choice.
+        scores = [0.0] * len(choices)
+        for _, score, index in process.extract_iter(query, choices, scorer=fuzz.token_set_ratio):
+            scores[index] = float(score)
+        return scores
+    return [_fallback_similarity(query, choice) if choice else 0.0 for choice in choices]
+
+
 def _fallback_similarity(a: str, b: str) -> float:
     import difflib
 
@@ -49,61 +84,100 @@ class MatchResult:
 
 
 def match_events_to_notifications(
-    events: List[Dict[str, Any]],
-    notifications: List[Dict[str, Any]],
+    events: Iterable[Dict[str, Any]],
+    notifications: Iterable[Dict[str, Any]],
     threshold: float = 70.0,
     window_before_min: int = 5,
     window_after_min: int = 30,
 ) -> Tuple[List[MatchResult], List[Dict[str, Any]], List[Dict[str, Any]]]:
-    unmatched_notifications = notifications[:]
+    notifications = list(notifications)
     matches: List[MatchResult] = []
     unmatched_events: List[Dict[str, Any]] = []
 
+    # Parse every device timestamp once and keep timestamped notifications sorted by
+    # (ts, original index): each event's time window is then a contiguous slice.
+    timed: List[Tuple[datetime, int]] = []
+    notif_times: List[Optional[datetime]] = []
+    notif_masks: List[int] = []
+    notif_titles: List[str] = []
+    notif_msgs: List[str] = []
+    for index, notif in enumerate(notifications):
+        get = notif.get
+        title = get("title", "")
+        text = get("text", "")
+        notif_ts = _parse_dt(get("tsDevice"))
+        if notif_ts:
+            timed.append((notif_ts, index))
+        notif_times.append(notif_ts)
+        notif_masks.append(_keyword_mask(title, text))
+        notif_titles.append((title or "").strip())
+        notif_msgs.append((text or "").strip())
+    timed.sort()
+    sorted_ts = [notif_ts for notif_ts, _ in timed]
+    sorted_idx = [index for _, index in timed]
+    # alive[i] is cleared once notification i is matched: O(1) "removal" that keeps
+    # the sorted arrays (and therefore the bisect positions) untouched.
+    alive = bytearray(b"\x01") * len(notifications)
+
+    before = timedelta(minutes=window_before_min)
+    after = timedelta(minutes=window_after_min)
+
     for event in events:
-        received = _parse_dt(event.get("received")) or _parse_dt(event.get("tsPollUtc"))
+        get = event.get
+        received = _parse_dt(get("received")) or _parse_dt(get("tsPollUtc"))
         if not received:
             unmatched_events.append(event)
             continue
 
-        window_start = received - timedelta(minutes=window_before_min)
-        window_end = received + timedelta(minutes=window_after_min)
+        lo = bisect_left(sorted_ts, received - before)
+        hi = bisect_right(sorted_ts, received + after)
+        title = get("title", "")
+        msg = get("msg", "")
+        event_mask = _keyword_mask(title, msg)
 
-        candidates = []
-        for notif in unmatched_notifications:
-            notif_ts = _parse_dt(notif.get("tsDevice"))
-            if not notif_ts:
-                continue
-            if window_start <= notif_ts <= window_end:
-                candidates.append((notif, notif_ts))
+        candidates = [index for index in sorted_idx[lo:hi] if alive[index]]
+        title_scores = similarity_many(title, [notif_titles[index] for index in candidates])
+        msg_scores = similarity_many(msg, [notif_msgs[index] for index in candidates])
 
         best_score = -1.0
-        best_notif = None
-        best_latency = None
-
-        for notif, notif_ts in candidates:
-            score = _score_event_notification(event, notif)
-            if score > best_score:
+        best_index = -1
+        for offset, index in enumerate(candidates):
+            score = _score_event_notification(
+                title_scores[offset], msg_scores[offset], event_mask, notif_masks[index]
+            )
+            # Ties go to the notification listed first, as with the former linear scan.
+            if score > best_score or (score == best_score and index < best_index):
                 best_score = score
-                best_notif = notif
-                best_latency = (notif_ts - received).total_seconds()
+                best_index = index
 
-        if best_notif and best_score >= threshold:
-            matches.append(MatchResult(event=event, notification=best_notif, score=best_score, latency_sec=best_latency or 0.0))
-            unmatched_notifications.remove(best_notif)
+        if best_index >= 0 and best_score >= threshold:
+            best_notif = notifications[best_index]
+            latency = (notif_times[best_index] - received).total_seconds()
+            matches.append(MatchResult(event=event, notification=best_notif, score=best_score, latency_sec=latency))
+            alive[best_index] = 0
         else:
             unmatched_events.append(event)
 
+    unmatched_notifications = [notif for index, notif in enumerate(notifications) if alive[index]]
     return matches, unmatched_events, unmatched_notifications
 
 
-def _score_event_notification(event: Dict[str, Any], notif: Dict[str, Any]) -> float:
-    title_score = similarity(event.get("title"), notif.get("title"))
-    msg_score = similarity(event.get("msg"), notif.get("text"))
-    base = 0.6 * msg_score + 0.4 * title_score
+def _keyword_mask(first: Any, second: Any) -> int:
+    """Bit i is set when _KEYWORDS[i] occurs in the lowercased combined text."""
+    text = f"{first} {second}".lower()
+    mask = 0
+    for bit, word in enumerate(_KEYWORDS):
+        if word in text:
+            mask |= 1 << bit
+    return mask
 
-    keywords = ["delay", "cancel", "platform", "track", "suppressed"]
-    event_text = f"{event.get('title', '')} {event.get('msg', '')}".lower()
-    notif_text = f"{notif.get('title', '')} {notif.get('text', '')}".lower()
-    overlap = sum(1 for word in keywords if word in event_text and word in notif_text)
-    return min(100.0, base + overlap * 5.0)
 
+def _score_event_notification(
+    title_score: float,
+    msg_score: float,
+    event_mask: int,
+    notif_mask: int,
+) -> float:
+    base = 0.6 * msg_score + 0.4 * title_score
+    overlap = (event_mask & notif_mask).bit_count()
+    return min(100.0, base + overlap * 5.0)
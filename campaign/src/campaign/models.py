@@ -4,7 +4,7 @@ from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
 
-@dataclass
+@dataclass(slots=True)
 class ScenarioItem:
     scenarioId: str
     beginDate: str
@@ -24,8 +24,18 @@ class ScenarioItem:
             hysteresis=dict(data.get("hysteresis") or {}),
         )
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "scenarioId": self.scenarioId,
+            "beginDate": self.beginDate,
+            "endDate": self.endDate,
+            "nPass": self.nPass,
+            "ctxRecon": self.ctxRecon,
+            "hysteresis": self.hysteresis,
+        }
+
 
-@dataclass
+@dataclass(slots=True)
 class Scenario:
     campaignName: str
     pollSec: int = 120
@@ -52,16 +62,6 @@ class Scenario:
             "preWindowMin": self.preWindowMin,
             "postWindowMin": self.postWindowMin,
             "maxRuntimeMin": self.maxRuntimeMin,
-            "items": [
-                {
-                    "scenarioId": item.scenarioId,
-                    "beginDate": item.beginDate,
-                    "endDate": item.endDate,
-                    "nPass": item.nPass,
-                    "ctxRecon": item.ctxRecon,
-                    "hysteresis": item.hysteresis,
-                }
-                for item in self.items
-            ],
+            "items": [item.to_dict() for item in self.items],
         }
 
@@ -1,25 +1,46 @@
 from __future__ import annotations
 
 import argparse
-import json
+import os
+import shutil
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Iterable, Optional
+from typing import Any, Iterable, Iterator, Optional
+
+from .io import json_dumps, json_loads
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover
+    ijson = None
+
+
+# Rows serialized before each write() on the output NDJSON.
+_WRITE_BATCH_ROWS = 1024
 
 
 def ms_to_dt(ms: int) -> datetime:
     return datetime.fromtimestamp(ms / 1000.0, tz=timezone.utc)
 
 
+@lru_cache(maxsize=65536)
 def iso_utc(ms: int) -> str:
     return ms_to_dt(ms).isoformat().replace("+00:00", "Z")
 
 
+@lru_cache(maxsize=8)
+def _offset_tz(offset_ms: int) -> timezone:
+    return timezone(timedelta(milliseconds=offset_ms))
+
+
+# Notification timestamps repeat across posted[]/removed[] and updates of the same
+# notification, so whole conversions are memoized, not just the tz objects.
+@lru_cache(maxsize=65536)
 def iso_local(ms: int, offset_ms: int | None) -> str:
     if offset_ms is None:
         return iso_utc(ms)
-    tz = timezone(timedelta(milliseconds=int(offset_ms)))
-    return ms_to_dt(ms).astimezone(tz).isoformat()
+    return ms_to_dt(ms).astimezone(_offset_tz(int(offset_ms))).isoformat()
 
 
 def pick(data: dict[str, Any], *keys: str, default: Any = None) -> Any:
@@ -30,13 +51,30 @@ def pick(data: dict[str, Any], *keys: str, default: Any = None) -> Any:
     return default
 
 
-def parse_package_filter(packages: Optional[str]) -> Optional[set[str]]:
+@lru_cache(maxsize=16)
+def parse_package_filter(packages: Optional[str]) -> Optional[frozenset[str]]:
     if not packages:
         return None
-    parsed = {pkg.strip() for pkg in packages.split(",") if pkg.strip()}
+    parsed = frozenset(pkg.strip() for pkg in packages.split(",") if pkg.strip())
     return parsed or None
 
 
+def _read_export_offset(export_json: Path) -> Any:
+    with export_json.open("rb") as handle:
+        for offset in ijson.items(handle, "device.offset", use_float=True):
+            return offset
+    return None
+
+
+def _iter_export_section(export_json: Path, section: str) -> Iterator[Any]:
+    with export_json.open("rb") as handle:
+        yield from ijson.items(handle, f"{section}.item", use_float=True)
+
+
+def _list_or_empty(value: Any) -> list:
+    return value if isinstance(value, list) else []
+
+
 def convert_notification_log_export(
     export_json: Path,
     out_ndjson: Path,
@@ -44,30 +82,44 @@ def convert_notification_log_export(
     append: bool = False,
     include_removed: bool = False,
     packages: Optional[Iterable[str]] = None,
+    include_raw: bool = False,
 ) -> int:
-    with export_json.open("r", encoding="utf-8") as handle:
-        obj = json.load(handle)
-
-    default_offset = None
-    device = obj.get("device") or {}
-    if isinstance(device, dict):
-        default_offset = device.get("offset")
-
-    package_filter = set(packages) if packages is not None else None
+    if ijson is not None:
+        # Stream posted[]/removed[] one item at a time instead of loading the whole export.
+        default_offset = _read_export_offset(export_json)
+        posted: Iterable[Any] = _iter_export_section(export_json, "posted")
+        removed: Iterable[Any] = _iter_export_section(export_json, "removed")
+    else:
+        obj = json_loads(export_json.read_bytes())
+        default_offset = None
+        device = obj.get("device") or {}
+        if isinstance(device, dict):
+            default_offset = device.get("offset")
+        posted = _list_or_empty(obj.get("posted"))
+        removed = _list_or_empty(obj.get("removed"))
+
+    if packages is None or isinstance(packages, frozenset):
+        package_filter = packages
+    else:
+        package_filter = frozenset(packages)
 
     out_ndjson.parent.mkdir(parents=True, exist_ok=True)
-    mode = "a" if append else "w"
     written = 0
 
-    def emit(items: Any, kind: str) -> None:
+    def flush(buf: list[bytes]) -> None:
+        if buf:
+            out_handle.write(b"\n".join(buf) + b"\n")
+            buf.clear()
+
+    def emit(items: Iterable[Any], kind: str) -> None:
         nonlocal written
-        if not isinstance(items, list):
-            return
+        buf: list[bytes] = []
         for item in items:
             if not isinstance(item, dict):
                 continue
+            get = item.get
             # Ignore Android group summary notifications (UI container, not real content)
-            if item.get("isGroupSummary") is True:
+            if get("isGroupSummary") is True:
                 continue
             pkg = pick(item, "packageName", "package")
             if package_filter is not None and pkg not in package_filter:
@@ -75,27 +127,46 @@ def convert_notification_log_export(
             ts_ms = pick(item, "postTime", "when", "systemTime")
             if not isinstance(ts_ms, (int, float)):
                 continue
-            offset_ms = pick(item, "offset", default=default_offset)
-            title = pick(item, "titleBig", "title", default="")
-            text = pick(item, "textBig", "text", default="")
+            ts_ms = int(ts_ms)
+            offset_ms = get("offset")
+            if offset_ms in (None, ""):
+                offset_ms = default_offset
+            channel = get("category")
             record = {
-                "tsDevice": iso_local(int(ts_ms), offset_ms),
-                "tsUtc": iso_utc(int(ts_ms)),
+                "tsDevice": iso_local(ts_ms, offset_ms),
+                "tsUtc": iso_utc(ts_ms),
                 "package": pkg,
-                "title": title,
-                "text": text,
-                "channel": pick(item, "category", default=None),
+                "title": pick(item, "titleBig", "title", default=""),
+                "text": pick(item, "textBig", "text", default=""),
+                "channel": None if channel in (None, "") else channel,
                 "id": pick(item, "nid", "key", default=None),
                 "kind": kind,
-                "raw": item,
             }
-            out_handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if include_raw:
+                record["raw"] = item
+            buf.append(json_dumps(record))
             written += 1
-
-    with out_ndjson.open(mode, encoding="utf-8") as out_handle:
-        emit(obj.get("posted"), "posted")
-        if include_removed:
-            emit(obj.get("removed"), "removed")
+            if len(buf) >= _WRITE_BATCH_ROWS:
+                flush(buf)
+        flush(buf)
+
+    # The streamed export is only validated as it is read: rows go to a sibling temp file
+    # that replaces (or is appended to) the output once the whole export has parsed.
+    tmp_path = out_ndjson.with_name(out_ndjson.name + ".tmp")
+    try:
+        with tmp_path.open("wb") as out_handle:
+            emit(posted, "posted")
+            if include_removed:
+                emit(removed, "removed")
+        if append and out_ndjson.exists():
+            with tmp_path.open("rb") as src, out_ndjson.open("ab") as dst:
+                shutil.copyfileobj(src, dst)
+            tmp_path.unlink()
+        else:
+            os.replace(tmp_path, out_ndjson)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
     return written
 
@@ -115,6 +186,11 @@ def build_parser() -> argparse.ArgumentParser:
         default="",
         help="Comma-separated packageName filter (optional)",
     )
+    parser.add_argument(
+        "--include-raw",
+        action="store_true",
+        help="Keep the full source item under 'raw' (debugging only)",
+    )
     return parser
 
 
@@ -128,6 +204,7 @@ def main() -> None:
         append=args.append,
         include_removed=args.include_removed,
         packages=packages,
+        include_raw=args.include_raw,
     )
     print(f"OK: wrote {written} NDJSON lines -> {args.out}")
 
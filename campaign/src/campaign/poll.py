@@ -1,16 +1,34 @@
 from __future__ import annotations
 
+import gzip
 import hashlib
 import heapq
 import json
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 from zoneinfo import ZoneInfo
-from dateutil import parser as dt_parser
 from .hafas_gate import HafasGate
-from .io import append_ndjson, ensure_dir, ensure_state, read_json, update_state, write_json_redacted
+from .io import (
+    NdjsonWriter,
+    append_ndjson,
+    append_state_delta,
+    compact_state,
+    ensure_dir,
+    ensure_state,
+    json_dumps,
+    json_loads,
+    list_subdirs,
+    read_json,
+    read_state,
+    redacted_json_dumps,
+    update_state,
+)
 
 try:
     from zoneinfo import ZoneInfo
@@ -28,32 +46,65 @@ try:
 
 except Exception:
     # fallback si zoneinfo vraiment indispo
-    from dateutil.tz import gettz
-    LOCAL_TZ = gettz("Europe/Paris") or timezone(timedelta(hours=1))
+    LOCAL_TZ = timezone(timedelta(hours=1))
 
 LOCAL_TZ_NAME = getattr(LOCAL_TZ, "key", "Europe/Paris")
 
+_UTC = timezone.utc
 
+# C ISO-8601 parser; since 3.11 it takes every RFC 3339 form HAFAS sends, trailing "Z",
+# basic format and compact offsets included.
+_FROMISO = datetime.fromisoformat
+
+# Per-subscription raw SubscrDetails log, one gzip file per poll run: one redacted
+# {"poll", "corrId", "req", "resp"} record per poll ("sameAs" instead of req/resp when the
+# response did not change). A killed run leaves its file without a gzip trailer; a file per
+# run keeps later runs from appending after that and making the whole file unreadable.
+_RAW_LOG_FILE = "raw/subscrdetails_{run}.ndjson.gz"
+
+# Append-only list of seen event keys, one {"k": key} row per line, next to state.json.
+_SEEN_KEYS_FILE = "seen_keys.ndjson"
+
+# Ticks between full state.json rewrites; the ticks in between only append to state.log.
+_STATE_COMPACT_EVERY = 128
+
+# Heap entries due within this many seconds of the popped one are polled together.
+_BATCH_EPSILON_SEC = 0.05
+
+# Longest time polled rows (rt_events, seen keys, poll log) stay buffered in memory.
+_LOG_FLUSH_SEC = 5.0
+
+
+# Window bounds, departure/arrival and planned end repeat on every poll of a subscription.
+# Aware datetimes hash by instant, which is all both renderings depend on.
+@lru_cache(maxsize=1024)
 def _iso_utc(value: Optional[datetime]) -> Optional[str]:
     if not value:
         return None
-    return value.astimezone(timezone.utc).isoformat()
+    if value.tzinfo is not _UTC:
+        value = value.astimezone(_UTC)
+    return value.isoformat()
 
 
+@lru_cache(maxsize=1024)
 def _iso_local(value: Optional[datetime]) -> Optional[str]:
     if not value:
         return None
+    # zoneinfo already caches transitions in C; a per-hour fixed-offset cache measured
+    # ~1.5x slower on a miss than converting with LOCAL_TZ directly.
     return value.astimezone(LOCAL_TZ).isoformat()
 
 
+# First character of an ISO offset suffix ("+01:00", "-05:00", "Z").
+_OFFSET_START_RE = re.compile(r"[+\-Z]")
+
+
 def _iso_time_part(iso_value: Optional[str]) -> str:
     if not iso_value:
         return "--:--:--"
-    time_part = iso_value.split("T")[-1]
-    for sep in ("+", "-", "Z"):
-        if sep in time_part:
-            time_part = time_part.split(sep)[0]
-    return time_part
+    _, _, time_part = iso_value.rpartition("T")
+    match = _OFFSET_START_RE.search(time_part)
+    return time_part[: match.start()] if match else time_part
 
 
 def _format_console_line(record: Dict[str, Any]) -> str:
@@ -68,10 +119,52 @@ def _format_console_line(record: Dict[str, Any]) -> str:
     )
 
 
-def _log_poll_event(subscr_dir: Path, record: Dict[str, Any], verbose: bool, save_logs: bool) -> None:
+# Every poll_log.ndjson field in output order; records only spell out what differs.
+_LOG_DEFAULTS: Dict[str, Any] = {
+    "tsUtc": None,
+    "tsLocal": None,
+    "subscrId": None,
+    "scenarioId": None,
+    "pollCount": None,
+    "in_window": None,
+    "window_start_utc": None,
+    "window_start_local": None,
+    "window_end_utc": None,
+    "window_end_local": None,
+    "dep_time_utc": None,
+    "dep_time_local": None,
+    "arr_time_utc": None,
+    "arr_time_local": None,
+    "planned_end_utc": None,
+    "planned_end_local": None,
+    "last_activity_utc": None,
+    "last_activity_local": None,
+    "idle_deadline_utc": None,
+    "idle_deadline_local": None,
+    "interval_sec": None,
+    "next_due_monotonic": None,
+    "next_due_utc": None,
+    "events_total": 0,
+    "new_events": 0,
+    "dedup_skipped": 0,
+    "done": False,
+    "done_reason": None,
+    "error_type": None,
+    "error_msg": None,
+    "where": None,
+}
+
+
+def _log_poll_event(
+    writer: NdjsonWriter,
+    subscr_dir: Path,
+    record: Dict[str, Any],
+    verbose: bool,
+    save_logs: bool,
+) -> None:
     if save_logs:
         try:
-            append_ndjson(subscr_dir / "poll" / "poll_log.ndjson", [record])
+            writer.write(subscr_dir / "poll" / "poll_log.ndjson", [record])
         except Exception:
             pass
     if verbose:
@@ -82,6 +175,26 @@ def _log_major(message: str) -> None:
     print(message)
 
 
+def _create_gzip(path: Path) -> gzip.GzipFile:
+    """Create a new gzip file at path, or at ``<stem>-2.ndjson.gz``... when it is taken.
+
+    Never appends: another run's file may end in a member torn by a kill, and a member
+    appended after it would make the whole file unreadable.
+    """
+    stem = path.name.removesuffix(".ndjson.gz")
+    candidate, n = path, 1
+    while True:
+        try:
+            return gzip.open(candidate, "xb", compresslevel=1)
+        except FileExistsError:
+            n += 1
+            candidate = path.with_name(f"{stem}-{n}.ndjson.gz")
+
+
+def _log_write_error(path: Path, exc: Exception) -> None:
+    _log_major(f"WARN: could not write {path}: {_short_error_message(exc)}")
+
+
 def _short_error_message(exc: Exception, limit: int = 200) -> str:
     msg = str(exc) or exc.__class__.__name__
     return msg[:limit]
@@ -92,11 +205,17 @@ def _parse_hafas_wallclock_to_utc(value: Optional[str]) -> Optional[datetime]:
     HAFAS dep/arr timestamps: treat as local wall-clock time even if suffixed with 'Z'.
     Return UTC datetime for comparisons/storage.
     """
-    if not value:
+    if not value or not isinstance(value, str):
         return None
+    return _parse_hafas_wallclock_cached(value)
+
+
+# dep/arr strings repeat on every poll of a subscription for its whole lifetime.
+@lru_cache(maxsize=4096)
+def _parse_hafas_wallclock_cached(value: str) -> Optional[datetime]:
     try:
         s = value.strip()
-        dt = dt_parser.isoparse(s)
+        dt = _FROMISO(s)
 
         # If it has no tz -> local
         if dt.tzinfo is None:
@@ -110,142 +229,232 @@ def _parse_hafas_wallclock_to_utc(value: Optional[str]) -> Optional[datetime]:
         else:
             local = dt.astimezone(LOCAL_TZ)
 
-        return local.astimezone(timezone.utc)
+        return local.astimezone(_UTC)
     except Exception:
         return None
-        
+
+
 def _parse_dt(value: Optional[str]) -> Optional[datetime]:
-    if not value:
+    if not value or not isinstance(value, str):
         return None
+    return _parse_dt_cached(value)
+
+
+@lru_cache(maxsize=4096)
+def _parse_dt_cached(value: str) -> Optional[datetime]:
     try:
-        parsed = dt_parser.isoparse(value)
-        # If HAFAS omits TZ, assume Europe/Luxembourg (not UTC)
+        parsed = _FROMISO(value)
+        # If HAFAS omits TZ, assume local wall-clock time (not UTC)
         if parsed.tzinfo is None:
-            parsed = parsed.replace(tzinfo=DEFAULT_TZ)
+            parsed = parsed.replace(tzinfo=LOCAL_TZ)
         # Normalize everything to UTC for comparisons/storage
-        return parsed.astimezone(timezone.utc)
+        return parsed.astimezone(_UTC)
     except (ValueError, TypeError):
         return None
 
+def _as_dict(value: Any) -> Dict[str, Any]:
+    return value if isinstance(value, dict) else {}
+
+def _first_dict(value: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return value[0]
+    return None
+
+def _svc_res(details: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    svc = _first_dict(details.get("svcResL"))
+    return _as_dict(svc.get("res")) if svc is not None else None
+
 def _get_connection_info0(details: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    try:
-        res = details["svcResL"][0]["res"]
-    except Exception:
+    res = _svc_res(details)
+    if res is None:
         return None
+    res_details = _as_dict(res.get("details"))
 
     # Preferred: res.details.conSubscr.connectionInfo[0]
-    try:
-        ci = res["details"]["conSubscr"]["connectionInfo"][0]
-        if isinstance(ci, dict):
-            return ci
-    except Exception:
-        pass
-
     # Alt: res.details.intvlSubscr.connectionInfo[0] (si jamais)
-    try:
-        ci = res["details"]["intvlSubscr"]["connectionInfo"][0]
-        if isinstance(ci, dict):
+    for subscr_key in ("conSubscr", "intvlSubscr"):
+        ci = _first_dict(_as_dict(res_details.get(subscr_key)).get("connectionInfo"))
+        if ci is not None:
             return ci
-    except Exception:
-        pass
 
     # Fallback: take conSecInfo from latest rtEvent
-    try:
-        eh = res["details"]["eventHistory"]
-        rt = eh.get("rtEvents") or []
-        if isinstance(rt, list) and rt:
-            last = rt[-1]
-            sec = (last.get("rtConSecInfos") or [])[0]
-            ci = (sec.get("conSecInfo") or {})
-            if isinstance(ci, dict) and ci:
-                return ci
-    except Exception:
-        pass
-
-    # Legacy fallback: res.connectionInfo[0]
-    try:
-        ci = res["connectionInfo"][0]
-        if isinstance(ci, dict):
+    rt = _as_dict(res_details.get("eventHistory")).get("rtEvents")
+    if isinstance(rt, list) and rt and isinstance(rt[-1], dict):
+        sec = _first_dict(rt[-1].get("rtConSecInfos"))
+        ci = sec.get("conSecInfo") if sec is not None else None
+        if isinstance(ci, dict) and ci:
             return ci
-    except Exception:
-        pass
-
-    return None
 
-def _extract_departure_time(details: Dict[str, Any]) -> Optional[datetime]:
-    ci0 = _get_connection_info0(details)
-    return _parse_hafas_wallclock_to_utc(ci0.get("departureTime")) if ci0 else None
+    # Legacy fallback: res.connectionInfo[0]
+    return _first_dict(res.get("connectionInfo"))
 
-def _extract_arrival_time(details: Dict[str, Any]) -> Optional[datetime]:
-    ci0 = _get_connection_info0(details)
-    return _parse_hafas_wallclock_to_utc(ci0.get("arrivalTime")) if ci0 else None
+def _connection_times(ci0: Optional[Dict[str, Any]]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """(departure, arrival) in UTC from an already located connectionInfo[0]."""
+    if not ci0:
+        return None, None
+    return (
+        _parse_hafas_wallclock_to_utc(ci0.get("departureTime")),
+        _parse_hafas_wallclock_to_utc(ci0.get("arrivalTime")),
+    )
 
 def _extract_rt_events(details: Dict[str, Any]) -> List[Dict[str, Any]]:
-    try:
-        res = details["svcResL"][0]["res"]
-    except Exception:
+    res = _svc_res(details)
+    if res is None:
         return []
 
     # Preferred: SubscrDetails -> res.details.eventHistory.rtEvents
-    try:
-        eh = res["details"]["eventHistory"]
+    eh = _as_dict(res.get("details")).get("eventHistory")
+    if isinstance(eh, dict):
         rt = eh.get("rtEvents") or []
         return rt if isinstance(rt, list) else []
-    except Exception:
-        pass
 
     # Fallback legacy: res.rtInfo.rtEventL
-    try:
-        rt = (res.get("rtInfo") or {}).get("rtEventL") or []
-        return rt if isinstance(rt, list) else []
-    except Exception:
-        return []
+    rt = _as_dict(res.get("rtInfo")).get("rtEventL") or []
+    return rt if isinstance(rt, list) else []
 
 
 def _compute_planned_end(details: Dict[str, Any], post_window_min: int) -> Optional[datetime]:
-    arrival = _extract_arrival_time(details)
-    departure = _extract_departure_time(details)
+    departure, arrival = _connection_times(_get_connection_info0(details))
+    return _planned_end(departure, arrival, timedelta(minutes=post_window_min))
+
+
+def _planned_end(
+    departure: Optional[datetime],
+    arrival: Optional[datetime],
+    post_window: timedelta,
+) -> Optional[datetime]:
     base = arrival or departure
     if not base:
         return None
-    return base + timedelta(minutes=post_window_min)
+    return base + post_window
 
 
 def _event_key(event: Dict[str, Any]) -> str:
     change_id = event.get("changeId")
     if change_id:
         return str(change_id)
+    # Keys are persisted (seen_keys.ndjson, legacy seenKeys), so this must stay exactly the
+    # original sha1 over stdlib json with default separators: any other bytes or hash would
+    # re-emit every changeId-less event when an existing run dir is resumed. Sorted keys
+    # make a response listing the same event's fields in another order map to one key.
     raw = json.dumps(event, sort_keys=True, ensure_ascii=False)
     return hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
 
+def _load_seen_keys(poll_state_dir: Path, state: Dict[str, Any]) -> set[str]:
+    """
+    Seen event keys from the append-only sidecar. A legacy ``seenKeys`` list still
+    in state.json is merged and copied to the sidecar before update_state drops it.
+    """
+    seen_path = poll_state_dir / _SEEN_KEYS_FILE
+    keys: set[str] = set()
+    if seen_path.exists():
+        line = b""
+        with seen_path.open("rb") as handle:
+            for line in handle:
+                try:
+                    keys.add(json_loads(line)["k"])
+                except ValueError:
+                    # Line torn by a crash mid-append: skip it (its event may be logged again).
+                    continue
+        if line and not line.endswith(b"\n"):
+            # End the torn line so the next append starts a row of its own.
+            with seen_path.open("ab") as handle:
+                handle.write(b"\n")
+    legacy = [key for key in state.get("seenKeys") or () if key not in keys]
+    if legacy:
+        append_ndjson(seen_path, [{"k": key} for key in legacy])
+        keys.update(legacy)
+    return keys
+
+
 def _normalize_event(
     event: Dict[str, Any],
+    key: str,
     scenario_id: str,
     subscr_id: int | None,
     corr_id: str,
     ts_poll_utc: str,
     include_raw: bool,
 ) -> Dict[str, Any]:
+    get = event.get
     normalized: Dict[str, Any] = {
         "tsPollUtc": ts_poll_utc,
         "corrId": corr_id,
         "subscrId": subscr_id,
         "scenarioId": scenario_id,
-        "key": _event_key(event),
-        "changeId": event.get("changeId"),
-        "changeType": event.get("changeType"),
-        "title": event.get("title"),
-        "msg": event.get("msg"),
-        "received": event.get("received"),
-        "date": event.get("date"),
-        "planrtTS": event.get("planrtTS"),
+        "key": key,
+        "changeId": get("changeId"),
+        "changeType": get("changeType"),
+        "title": get("title"),
+        "msg": get("msg"),
+        "received": get("received"),
+        "date": get("date"),
+        "planrtTS": get("planrtTS"),
     }
     if include_raw:
         normalized["raw"] = event
     return normalized
 
 
+def _new_event_rows(
+    events: List[Dict[str, Any]],
+    seen_keys: set[str],
+    scenario_id: str,
+    subscr_id: int,
+    corr_id: str,
+    ts_poll_utc: str,
+    include_raw: bool,
+) -> List[Dict[str, Any]]:
+    """Normalized rows for the events not seen yet; their keys are added to seen_keys.
+
+    A key is marked seen as soon as it is kept, so duplicates inside one response count
+    once. Fully annotated and free of dynamic tricks so it stays compilable with mypyc.
+    """
+    rows: List[Dict[str, Any]] = []
+    for event in events:
+        # _event_key's changeId fast path, inlined: HAFAS rtEvents normally carry one.
+        change_id = event.get("changeId")
+        key = str(change_id) if change_id else _event_key(event)
+        if key in seen_keys:
+            continue
+        seen_keys.add(key)
+        rows.append(_normalize_event(event, key, scenario_id, subscr_id, corr_id, ts_poll_utc, include_raw))
+    return rows
+
+
+def _persisted_next_due_in(state: Dict[str, Any], now: datetime, max_delay: float) -> Optional[float]:
+    """Seconds until the next poll a previous run scheduled, if it is still ahead.
+
+    Capped at max_delay so a clock change between runs cannot park a subscription.
+    """
+    next_due = _parse_dt(state.get("next_due_utc"))
+    if next_due is None:
+        return None
+    delay = (next_due - now).total_seconds()
+    return min(delay, max_delay) if delay > 0 else None
+
+
+@dataclass(slots=True)
+class _PollJob:
+    """One due subscription: what _prepare loaded and what _fetch got back from HAFAS."""
+
+    idx: int
+    subscr_dir: Path
+    subscr_id: Any
+    scenario_id: str
+    poll_state_dir: Path
+    state_path: Path
+    seen_keys: set[str]
+    poll_count: int
+    last_activity: Optional[datetime]
+    planned_end_state: Optional[datetime]
+    details: Dict[str, Any] = field(default_factory=dict)
+    corr_id: str = ""
+    request_payload: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[Exception] = None
+
+
 def run_poll(
     run_dir: Path,
     hafas: HafasGate,
@@ -257,6 +466,7 @@ def run_poll(
     include_raw: bool = False,
     save_logs: bool = True,
     verbose: bool = False,
+    max_workers: int = 4,
 ) -> None:
     subs_dir = run_dir / "subs"
     if not subs_dir.exists():
@@ -264,13 +474,23 @@ def run_poll(
         _log_major(f"No subs directory found under {run_dir}")
         return
 
-    subscr_dirs = sorted([p for p in subs_dir.iterdir() if p.is_dir()])
+    subscr_dirs = list_subdirs(subs_dir)
     if not subscr_dirs:
         _log_major(f"No subscriptions found under {subs_dir}")
         return
 
-    start_time = datetime.now(timezone.utc)
-    deadline = start_time + timedelta(minutes=max_runtime_min) if max_runtime_min else None
+    # The run deadline lives on the monotonic clock like the scheduler itself,
+    # so the sleep loop never has to build aware datetimes.
+    deadline_mono = time.monotonic() + max_runtime_min * 60 if max_runtime_min else None
+    pre_window = timedelta(minutes=pre_window_min)
+    post_window = timedelta(minutes=post_window_min)
+    idle_grace = timedelta(minutes=idle_grace_min)
+    # Credentials do not change during a run: one redaction map serves every raw log write.
+    secrets = {
+        hafas.config.aid: "<AID>",
+        hafas.config.user_id: "<USER_ID>",
+        hafas.config.channel_id: "<CHANNEL_ID>",
+    }
     _log_major(
         f"Polling {len(subscr_dirs)} subscriptions from {run_dir} "
         f"(pollSec={poll_sec}, preWindowMin={pre_window_min}, postWindowMin={post_window_min}, "
@@ -279,89 +499,87 @@ def run_poll(
     )
 
     # Scheduler: each subscription has its own next_due (monotonic seconds).
-    # Initial staggering spreads the first round across poll_sec to avoid bursts.
+    # A subscription whose previous run recorded a next_due_utc still ahead resumes at it;
+    # the others are staggered across poll_sec to avoid bursts.
     n = len(subscr_dirs)
+    now_utc = datetime.now(_UTC)
     base = time.monotonic()
     slot = poll_sec / max(1, n)
-
-    # heap entries: (due_monotonic, idx, subscr_dir)
-    heap: List[Tuple[float, int, Path]] = []
-    for i, d in enumerate(subscr_dirs):
-        heapq.heappush(heap, (base + i * slot, i, d))
+    max_interval = float(max(poll_sec, min(poll_sec * 2, 900)))
+
+    # idx -> manifest, cached once it carries a subscrId.
+    manifests: Dict[int, Dict[str, Any]] = {}
+    # idx -> (digest of the last raw response written, pollCount it was written under).
+    # Only touched by the raw-log thread.
+    raw_digests: Dict[int, Tuple[bytes, int]] = {}
+    # idx -> open raw gzip log; only touched by the raw-log thread until it is shut down.
+    raw_logs: Dict[int, gzip.GzipFile] = {}
+    raw_log_name = _RAW_LOG_FILE.format(run=f"{datetime.now(_UTC):%Y%m%dT%H%M%SZ}")
+    # idx -> state as persisted (snapshot plus deltas), read once and then kept in step
+    # with every write so later polls never re-read state.json/state.log.
+    states: Dict[int, Dict[str, Any]] = {}
+    # idx -> seen event keys, loaded on first visit and kept for the whole run.
+    seen_by_idx: Dict[int, set[str]] = {}
+
+    # heap entries: (due_monotonic, idx); per-subscription data lives in lists/dicts keyed by idx.
+    heap: List[Tuple[float, int]] = []
+    for i, subscr_dir in enumerate(subscr_dirs):
+        # The state read here for the resume time is also the one the first poll uses.
+        try:
+            state = read_state(subscr_dir / "poll" / "state.json")
+        except Exception:
+            state = {}
+        if state.get("done"):
+            # Finished in an earlier run: scheduling it would only delay the exit.
+            continue
+        if state:
+            states[i] = state
+        resume_in = _persisted_next_due_in(state, now_utc, max_interval)
+        heap.append((base + (resume_in if resume_in is not None else i * slot), i))
+    heapq.heapify(heap)
 
     def _deadline_reached() -> bool:
-        return bool(deadline and datetime.now(timezone.utc) >= deadline)
+        return deadline_mono is not None and time.monotonic() >= deadline_mono
 
     def _sleep_until(due_mono: float) -> bool:
         """Sleep until due_mono or until deadline. Returns False if deadline reached."""
         while True:
-            if _deadline_reached():
-                return False
             now_mono = time.monotonic()
+            if deadline_mono is not None and now_mono >= deadline_mono:
+                return False
             wait = due_mono - now_mono
             if wait <= 0:
                 return True
 
-            if deadline:
-                remaining = (deadline - datetime.now(timezone.utc)).total_seconds()
-                if remaining <= 0:
-                    return False
-                time.sleep(min(wait, remaining))
+            if deadline_mono is not None:
+                time.sleep(min(wait, deadline_mono - now_mono))
             else:
                 time.sleep(wait)
 
-    def _reschedule(idx: int, subscr_dir: Path, after_sec: float) -> None:
+    def _reschedule(idx: int, after_sec: float) -> None:
         """Reschedule a subscription after after_sec seconds (monotonic)."""
         next_due = time.monotonic() + max(0.0, float(after_sec))
-        heapq.heappush(heap, (next_due, idx, subscr_dir))
-
-    # Changelog: add dynamic idle grace stop logic after planned arrival windows.
-    while True:
-        if not heap:
-            break
-        if _deadline_reached():
-            break
-        due_mono, idx, subscr_dir = heapq.heappop(heap)
-        if not _sleep_until(due_mono):
-            break
+        heapq.heappush(heap, (next_due, idx))
 
+    def _prepare(idx: int) -> Optional[_PollJob]:
+        """Load manifest/state for a due subscription; None if it was skipped or backed off."""
+        subscr_dir = subscr_dirs[idx]
         # --- Read manifest safely ---
+        # Manifests are written once by subscribe; a valid one is read a single time per run.
         try:
-            manifest = read_json(subscr_dir / "manifest.json")
+            manifest = manifests.get(idx) or read_json(subscr_dir / "manifest.json")
         except Exception:
             # Pas de manifest -> on réessaie plus tard (et on évite de tuer tout le poll)
-            now = datetime.now(timezone.utc)
+            now = datetime.now(_UTC)
             _log_major(f"WARN: missing manifest for {subscr_dir} (backoff)")
             _log_poll_event(
+                writer,
                 subscr_dir,
-                {
+                _LOG_DEFAULTS
+                | {
                     "tsUtc": _iso_utc(now),
                     "tsLocal": _iso_local(now),
-                    "subscrId": None,
-                    "scenarioId": None,
-                    "pollCount": None,
-                    "in_window": None,
-                    "window_start_utc": None,
-                    "window_start_local": None,
-                    "window_end_utc": None,
-                    "window_end_local": None,
-                    "dep_time_utc": None,
-                    "dep_time_local": None,
-                    "arr_time_utc": None,
-                    "arr_time_local": None,
-                    "planned_end_utc": None,
-                    "planned_end_local": None,
-                    "last_activity_utc": None,
-                    "last_activity_local": None,
-                    "idle_deadline_utc": None,
-                    "idle_deadline_local": None,
                     "interval_sec": min(poll_sec * 2, 900),
-                    "next_due_monotonic": None,
-                    "next_due_utc": None,
-                    "events_total": 0,
-                    "new_events": 0,
-                    "dedup_skipped": 0,
-                    "done": False,
                     "done_reason": "missing_manifest",
                     "error_type": "manifest_read_error",
                     "error_msg": "missing manifest.json",
@@ -370,46 +588,25 @@ def run_poll(
                 verbose,
                 save_logs,
             )
-            _reschedule(idx, subscr_dir, min(poll_sec * 2, 900))
-            continue
+            _reschedule(idx, min(poll_sec * 2, 900))
+            return None
 
         subscr_id = manifest.get("subscrId")
         scenario_id = manifest.get("scenarioId", "unknown")
 
         if not subscr_id:
             # Sub sans subscrId -> on réessaie plus tard
-            now = datetime.now(timezone.utc)
+            now = datetime.now(_UTC)
             _log_major(f"WARN: missing subscrId for {subscr_dir} (backoff)")
             _log_poll_event(
+                writer,
                 subscr_dir,
-                {
+                _LOG_DEFAULTS
+                | {
                     "tsUtc": _iso_utc(now),
                     "tsLocal": _iso_local(now),
-                    "subscrId": None,
                     "scenarioId": scenario_id,
-                    "pollCount": None,
-                    "in_window": None,
-                    "window_start_utc": None,
-                    "window_start_local": None,
-                    "window_end_utc": None,
-                    "window_end_local": None,
-                    "dep_time_utc": None,
-                    "dep_time_local": None,
-                    "arr_time_utc": None,
-                    "arr_time_local": None,
-                    "planned_end_utc": None,
-                    "planned_end_local": None,
-                    "last_activity_utc": None,
-                    "last_activity_local": None,
-                    "idle_deadline_utc": None,
-                    "idle_deadline_local": None,
                     "interval_sec": min(poll_sec * 2, 900),
-                    "next_due_monotonic": None,
-                    "next_due_utc": None,
-                    "events_total": 0,
-                    "new_events": 0,
-                    "dedup_skipped": 0,
-                    "done": False,
                     "done_reason": "missing_subscr_id",
                     "error_type": "missing_subscr_id",
                     "error_msg": "manifest without subscrId",
@@ -418,48 +615,29 @@ def run_poll(
                 verbose,
                 save_logs,
             )
-            _reschedule(idx, subscr_dir, min(poll_sec * 2, 900))
-            continue
+            _reschedule(idx, min(poll_sec * 2, 900))
+            return None
 
+        manifests[idx] = manifest
         poll_state_dir = subscr_dir / "poll"
         ensure_dir(poll_state_dir)
 
         state_path = poll_state_dir / "state.json"
         try:
-            state = ensure_state(state_path)
+            state = states.get(idx) or ensure_state(state_path)
         except Exception as exc:
-            now = datetime.now(timezone.utc)
+            now = datetime.now(_UTC)
             _log_major(f"ERROR: failed to read state for {subscr_dir} (backoff)")
             _log_poll_event(
+                writer,
                 subscr_dir,
-                {
+                _LOG_DEFAULTS
+                | {
                     "tsUtc": _iso_utc(now),
                     "tsLocal": _iso_local(now),
                     "subscrId": subscr_id,
                     "scenarioId": scenario_id,
-                    "pollCount": None,
-                    "in_window": None,
-                    "window_start_utc": None,
-                    "window_start_local": None,
-                    "window_end_utc": None,
-                    "window_end_local": None,
-                    "dep_time_utc": None,
-                    "dep_time_local": None,
-                    "arr_time_utc": None,
-                    "arr_time_local": None,
-                    "planned_end_utc": None,
-                    "planned_end_local": None,
-                    "last_activity_utc": None,
-                    "last_activity_local": None,
-                    "idle_deadline_utc": None,
-                    "idle_deadline_local": None,
                     "interval_sec": min(poll_sec * 2, 900),
-                    "next_due_monotonic": None,
-                    "next_due_utc": None,
-                    "events_total": 0,
-                    "new_events": 0,
-                    "dedup_skipped": 0,
-                    "done": False,
                     "done_reason": "state_read_error",
                     "error_type": exc.__class__.__name__,
                     "error_msg": _short_error_message(exc),
@@ -468,52 +646,118 @@ def run_poll(
                 verbose,
                 save_logs,
             )
-            _reschedule(idx, subscr_dir, min(poll_sec * 2, 900))
-            continue
+            _reschedule(idx, min(poll_sec * 2, 900))
+            return None
+        states[idx] = state
         if state.get("done"):
-            continue
-        seen_keys = set(state.get("seenKeys", []))
+            return None
+        seen_keys = seen_by_idx.get(idx)
+        if seen_keys is None:
+            seen_keys = seen_by_idx[idx] = _load_seen_keys(poll_state_dir, state)
         poll_count = int(state.get("pollCount") or 0)
         last_activity = _parse_dt(state.get("lastActivityUtc"))
         planned_end_state = _parse_dt(state.get("plannedEndUtc"))
+        return _PollJob(
+            idx=idx,
+            subscr_dir=subscr_dir,
+            subscr_id=subscr_id,
+            scenario_id=scenario_id,
+            poll_state_dir=poll_state_dir,
+            state_path=state_path,
+            seen_keys=seen_keys,
+            poll_count=poll_count,
+            last_activity=last_activity,
+            planned_end_state=planned_end_state,
+        )
 
-        # --- Call HAFAS safely ---
+    def _fetch(job: _PollJob) -> None:
+        """The only blocking network call of a tick; errors are kept for _process."""
+        try:
+            job.details, job.corr_id, job.request_payload = hafas.subscr_details(job.subscr_id)
+        except Exception as exc:
+            job.error = exc
+
+    def _write_raw(
+        idx: int,
+        raw_path: Path,
+        poll_count: int,
+        details: Dict[str, Any],
+        request_payload: Dict[str, Any],
+        corr_id: str,
+    ) -> None:
+        """Append one poll's redacted request/response to this run's gzip log of the subscription.
+
+        Runs on the single raw-log thread, in submission order.
+        """
         try:
-            details, corr_id, request_payload = hafas.subscr_details(subscr_id)
+            resp = redacted_json_dumps(details, secrets)
+            digest = hashlib.blake2b(resp, digest_size=16).digest()
+            previous = raw_digests.get(idx)
+            same = False
+            if previous is not None and previous[0] == digest:
+                same = True
+                # Same response as an earlier poll (the request never changes): point at
+                # that poll's record instead of storing an identical copy again.
+                line = json_dumps({"poll": poll_count, "corrId": corr_id, "sameAs": previous[1]})
+            else:
+                # Spliced from the already serialized parts so the response is encoded once.
+                line = b"".join(
+                    (
+                        json_dumps({"poll": poll_count, "corrId": corr_id})[:-1],
+                        b',"req":',
+                        redacted_json_dumps(request_payload, secrets),
+                        b',"resp":',
+                        resp,
+                        b"}",
+                    )
+                )
+            handle = raw_logs.get(idx)
+            if handle is None:
+                ensure_dir(raw_path.parent)
+                handle = raw_logs[idx] = _create_gzip(raw_path)
+            handle.write(line + b"\n")
+            # Sync-flush per record: a crash only loses the record being written; the
+            # trailer is written when the run closes the file.
+            handle.flush()
+            if not same:
+                # Only a record that made it to the file may be pointed at by "sameAs".
+                raw_digests[idx] = (digest, poll_count)
         except Exception as exc:
+            # Logging ne doit jamais casser le poll, but a lost raw log must not go unnoticed.
+            _log_write_error(raw_path, exc)
+
+    def _process(job: _PollJob, due_mono: float) -> None:
+        idx = job.idx
+        subscr_dir = job.subscr_dir
+        subscr_id = job.subscr_id
+        scenario_id = job.scenario_id
+        poll_state_dir = job.poll_state_dir
+        state_path = job.state_path
+        seen_keys = job.seen_keys
+        poll_count = job.poll_count
+        last_activity = job.last_activity
+        planned_end_state = job.planned_end_state
+
+        exc = job.error
+        if exc is not None:
             # Réseau/500/timeout: on backoff sans tout arrêter
-            now = datetime.now(timezone.utc)
+            now = datetime.now(_UTC)
             _log_major(f"ERROR: poll failed for subscr {subscr_id} (backoff)")
             _log_poll_event(
+                writer,
                 subscr_dir,
-                {
+                _LOG_DEFAULTS
+                | {
                     "tsUtc": _iso_utc(now),
                     "tsLocal": _iso_local(now),
                     "subscrId": subscr_id,
                     "scenarioId": scenario_id,
                     "pollCount": poll_count,
-                    "in_window": None,
-                    "window_start_utc": None,
-                    "window_start_local": None,
-                    "window_end_utc": None,
-                    "window_end_local": None,
-                    "dep_time_utc": None,
-                    "dep_time_local": None,
-                    "arr_time_utc": None,
-                    "arr_time_local": None,
                     "planned_end_utc": _iso_utc(planned_end_state),
                     "planned_end_local": _iso_local(planned_end_state),
                     "last_activity_utc": _iso_utc(last_activity),
                     "last_activity_local": _iso_local(last_activity),
-                    "idle_deadline_utc": None,
-                    "idle_deadline_local": None,
                     "interval_sec": min(poll_sec * 2, 900),
-                    "next_due_monotonic": None,
-                    "next_due_utc": None,
-                    "events_total": 0,
-                    "new_events": 0,
-                    "dedup_skipped": 0,
-                    "done": False,
                     "done_reason": "network_error_backoff",
                     "error_type": exc.__class__.__name__,
                     "error_msg": _short_error_message(exc),
@@ -522,35 +766,30 @@ def run_poll(
                 verbose,
                 save_logs,
             )
-            _reschedule(idx, subscr_dir, min(poll_sec * 2, 900))
-            continue
+            _reschedule(idx, min(poll_sec * 2, 900))
+            return
+
+        details = job.details
+        corr_id = job.corr_id
+        request_payload = job.request_payload
 
         # --- Logs ---
-        if save_logs:
-            try:
-                secrets = {
-                    hafas.config.aid: "<AID>",
-                    hafas.config.user_id: "<USER_ID>",
-                    hafas.config.channel_id: "<CHANNEL_ID>",
-                }
-                raw_dir = subscr_dir / "raw"
-                ensure_dir(raw_dir)
-                write_json_redacted(raw_dir / f"{poll_count:02d}_subscrdetails_resp.json", details, secrets)
-                write_json_redacted(raw_dir / f"{poll_count:02d}_subscrdetails_req.json", request_payload, secrets)
-                (raw_dir / f"{poll_count:02d}_subscrdetails_corrid.txt").write_text(corr_id, encoding="utf-8")
-            except Exception:
-                # Logging ne doit jamais casser le poll
-                pass
+        if raw_logger is not None:
+            raw_logger.submit(
+                _write_raw, idx, subscr_dir / raw_log_name, poll_count, details, request_payload, corr_id
+            )
 
-        now = datetime.now(timezone.utc)
-        arr_time = _extract_arrival_time(details)
-        dep_time = _extract_departure_time(details)
-        planned_end = _compute_planned_end(details, post_window_min) or planned_end_state
+        now = datetime.now(_UTC)
+        # connectionInfo[0] is located once per poll and shared by every derived time.
+        dep_time, arr_time = _connection_times(_get_connection_info0(details))
+        planned_end = _planned_end(dep_time, arr_time, post_window) or planned_end_state
         planned_end_utc = _iso_utc(planned_end)
 
         if dep_time:
-            window_start = dep_time - timedelta(minutes=pre_window_min)
-            window_end = (arr_time or dep_time) + timedelta(minutes=post_window_min)
+            window_start = dep_time - pre_window
+            window_end = (arr_time or dep_time) + post_window
+            # All operands carry the same _UTC tzinfo object, so datetime compares fields
+            # directly without utcoffset() calls; converting to epoch ints first costs more.
             in_window = window_start <= now <= window_end
         else:
             window_start = None
@@ -559,20 +798,14 @@ def run_poll(
 
         activity = False
         events = _extract_rt_events(details)
-        ts_poll_utc = now.isoformat()
-        normalized_rows: List[Dict[str, Any]] = []
-
-        for event in events:
-            key = _event_key(event)
-            if key in seen_keys:
-                continue
-            seen_keys.add(key)
-            normalized_rows.append(
-                _normalize_event(event, scenario_id, int(subscr_id), corr_id, ts_poll_utc, include_raw)
-            )
+        normalized_rows = _new_event_rows(
+            events, seen_keys, scenario_id, int(subscr_id), corr_id, now.isoformat(), include_raw
+        )
 
         if normalized_rows:
-            append_ndjson(poll_state_dir / "rt_events.ndjson", normalized_rows)
+            writer.write(poll_state_dir / "rt_events.ndjson", normalized_rows)
+            # Only the new keys hit the disk; flushed together with rt_events.
+            writer.write(poll_state_dir / _SEEN_KEYS_FILE, [{"k": row["key"]} for row in normalized_rows])
             activity = True
 
         if activity:
@@ -587,25 +820,10 @@ def run_poll(
         if planned_end:
             if last_activity is None:
                 last_activity = planned_end
-            idle_deadline = last_activity + timedelta(minutes=idle_grace_min)
+            idle_deadline = last_activity + idle_grace
             if now > planned_end and now > idle_deadline:
                 done = True
                 done_reason = "idle_grace_elapsed"
-        update_state(
-            state_path,
-            seen_keys,
-            poll_count=poll_count,
-            last_activity_utc=last_activity.isoformat() if last_activity else None,
-            planned_end_utc=planned_end_utc,
-            done=done,
-            extra_fields={
-                "dep_time": _iso_utc(dep_time),
-                "arr_time": _iso_utc(arr_time),
-                "window_start": _iso_utc(window_start),
-                "window_end": _iso_utc(window_end),
-                "in_window": in_window,
-            },
-        )
         interval = None
         next_due = None
         if dep_time is None:
@@ -623,9 +841,32 @@ def run_poll(
             next_due = now_mono
         next_due_utc = now + timedelta(seconds=interval)
 
+        progress: Dict[str, Any] = {
+            "poll_count": poll_count,
+            "last_activity_utc": last_activity.isoformat() if last_activity else None,
+            "planned_end_utc": planned_end_utc,
+            "done": done,
+            "extra_fields": {
+                "dep_time": _iso_utc(dep_time),
+                "arr_time": _iso_utc(arr_time),
+                "window_start": _iso_utc(window_start),
+                "window_end": _iso_utc(window_end),
+                "in_window": in_window,
+                # Lets the next run resume this subscription's schedule after a restart.
+                "next_due_utc": _iso_utc(next_due_utc),
+            },
+        }
+        # Most ticks append a small delta to state.log; the snapshot is only rewritten
+        # periodically and when the subscription is done.
+        if done or poll_count % _STATE_COMPACT_EVERY == 0:
+            states[idx] = update_state(state_path, current=states[idx], **progress)
+        else:
+            states[idx].update(append_state_delta(state_path, **progress))
         _log_poll_event(
+            writer,
             subscr_dir,
-            {
+            _LOG_DEFAULTS
+            | {
                 "tsUtc": _iso_utc(now),
                 "tsLocal": _iso_local(now),
                 "subscrId": subscr_id,
@@ -654,9 +895,6 @@ def run_poll(
                 "dedup_skipped": len(events) - len(normalized_rows),
                 "done": done,
                 "done_reason": done_reason or ("completed" if done else "running"),
-                "error_type": None,
-                "error_msg": None,
-                "where": None,
             },
             verbose,
             save_logs,
@@ -666,13 +904,71 @@ def run_poll(
                 f"Done: subscr={subscr_id} scen={scenario_id} "
                 f"reason={done_reason or 'completed'}"
             )
-            continue
+            return
 
         # --- Reschedule this subscription ---
-        heapq.heappush(heap, (next_due, idx, subscr_dir))
+        heapq.heappush(heap, (next_due, idx))
 
-        if _deadline_reached():
-            break
+    # More workers than pooled connections would only queue inside requests.
+    workers = max(1, min(max_workers, hafas.config.pool_maxsize))
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    # Logging ne doit jamais casser le poll: a failed write is reported and its rows stay
+    # queued for the next flush.
+    writer = NdjsonWriter(flush_interval=_LOG_FLUSH_SEC, on_error=_log_write_error)
+    # Raw copies are off the polling path; one worker keeps each subscription's files in order.
+    raw_logger = ThreadPoolExecutor(max_workers=1, thread_name_prefix="raw-log") if save_logs else None
+
+    # Changelog: add dynamic idle grace stop logic after planned arrival windows.
+    try:
+        while True:
+            if not heap:
+                break
+            if _deadline_reached():
+                break
+            due_mono, idx = heapq.heappop(heap)
+            if not _sleep_until(due_mono):
+                break
+
+            # Everything else already due joins this batch so one slow HAFAS call
+            # does not hold back the subscriptions queued behind it.
+            batch = [(due_mono, idx)]
+            horizon = time.monotonic() + _BATCH_EPSILON_SEC
+            while heap and heap[0][0] <= horizon:
+                batch.append(heapq.heappop(heap))
+
+            jobs: List[Tuple[float, _PollJob]] = []
+            for due_mono, idx in batch:
+                job = _prepare(idx)
+                if job is not None:
+                    jobs.append((due_mono, job))
+            if executor is not None and len(jobs) > 1:
+                # map() re-raises nothing here: _fetch stores errors on the job.
+                list(executor.map(_fetch, [job for _, job in jobs]))
+            else:
+                for _, job in jobs:
+                    _fetch(job)
+            for due_mono, job in jobs:
+                _process(job, due_mono)
+            # Rows of consecutive batches share one write per file; they wait at most
+            # _LOG_FLUSH_SEC, and never across the sleep until the next due poll.
+            writer.maybe_flush(until=heap[0][0] if heap else None)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if raw_logger is not None:
+            raw_logger.shutdown(wait=True)
+        for handle in raw_logs.values():
+            try:
+                handle.close()
+            except Exception:
+                pass
+        writer.close()
+        for subscr_dir in subscr_dirs:
+            try:
+                compact_state(subscr_dir / "poll" / "state.json")
+            except Exception:
+                # Un log non compacté est simplement rejoué par read_state au prochain run
+                pass
 
     if _deadline_reached():
         _log_major("Polling stopped: deadline_reached")
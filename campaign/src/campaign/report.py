@@ -1,14 +1,13 @@
 from __future__ import annotations
 
 import csv
-import json
-from collections import defaultdict
+from collections import Counter
 from dataclasses import asdict
 from pathlib import Path
-from statistics import mean, median
-from typing import Any, Dict, List, Optional
+from statistics import fmean
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from .io import ensure_dir, read_ndjson, write_json
+from .io import ensure_dir, iter_ndjson, list_subdirs, write_json
 from .matching import MatchResult, match_events_to_notifications
 
 
@@ -24,6 +23,8 @@ def run_report(
 
     events = _load_events(run_dir)
     notifications = _load_notifications(run_dir, device_ndjson)
+    # One pass over all events: device notifications carry no subscrId, and each match
+    # consumes its notification, so the matching cannot be split per subscription.
     matches, unmatched_events, unmatched_notifications = match_events_to_notifications(
         events, notifications, threshold=match_threshold
     )
@@ -33,7 +34,7 @@ def run_report(
     _write_unmatched(report_dir / "unmatched_notifications.csv", unmatched_notifications)
 
     summary = _compute_metrics(events, matches)
-    write_json(report_dir / "report_summary.json", summary)
+    write_json(report_dir / "report_summary.json", summary, pretty=True)
     _write_metrics_csv(report_dir, summary)
 
     if write_markdown:
@@ -45,23 +46,26 @@ def run_report(
 
 def _load_events(run_dir: Path) -> List[Dict[str, Any]]:
     events: List[Dict[str, Any]] = []
-    for subscr_dir in (run_dir / "subs").iterdir():
-        poll_path = subscr_dir / "poll/rt_events.ndjson"
-        events.extend(read_ndjson(poll_path))
+    for subscr_dir in list_subdirs(run_dir / "subs"):
+        for event in iter_ndjson(subscr_dir / "poll/rt_events.ndjson"):
+            # Rows polled with --include-raw embed the whole rtEvent; matching and the
+            # metrics only read normalized fields, so don't keep it for the whole run.
+            event.pop("raw", None)
+            events.append(event)
     return events
 
 
-def _load_notifications(run_dir: Path, device_ndjson: Optional[Path]) -> List[Dict[str, Any]]:
+def _load_notifications(run_dir: Path, device_ndjson: Optional[Path]) -> Iterable[Dict[str, Any]]:
     if device_ndjson is not None:
         if device_ndjson.exists():
-            return read_ndjson(device_ndjson)
+            return iter_ndjson(device_ndjson)
         raise FileNotFoundError(
             f"Device NDJSON not found at {device_ndjson}. "
             "Provide --device-ndjson or run sync-device-notifs to populate the run folder."
         )
     default_path = run_dir / "device/notifications.ndjson"
     if default_path.exists():
-        return read_ndjson(default_path)
+        return iter_ndjson(default_path)
     raise FileNotFoundError(
         f"Device NDJSON not found at {default_path}. "
         "Provide --device-ndjson or run sync-device-notifs to populate the run folder."
@@ -84,26 +88,28 @@ def _write_matches(path: Path, matches: List[MatchResult]) -> None:
     ]
     ensure_dir(path.parent)
     with path.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
-        for match in matches:
-            event = match.event
-            notif = match.notification
-            writer.writerow(
-                {
-                    "subscrId": event.get("subscrId"),
-                    "scenarioId": event.get("scenarioId"),
-                    "changeType": event.get("changeType"),
-                    "eventReceivedUtc": event.get("received") or event.get("tsPollUtc"),
-                    "notifTsDevice": notif.get("tsDevice"),
-                    "latencySec": match.latency_sec,
-                    "score": match.score,
-                    "eventTitle": event.get("title"),
-                    "notifTitle": notif.get("title"),
-                    "eventMsg": event.get("msg"),
-                    "notifText": notif.get("text"),
-                }
-            )
+        # Positional rows through writerows() skip DictWriter's per-row dict-to-list step.
+        writer = csv.writer(handle)
+        writer.writerow(fieldnames)
+        writer.writerows(map(_match_row, matches))
+
+
+def _match_row(match: MatchResult) -> Tuple[Any, ...]:
+    event = match.event
+    notif = match.notification
+    return (
+        event.get("subscrId"),
+        event.get("scenarioId"),
+        event.get("changeType"),
+        event.get("received") or event.get("tsPollUtc"),
+        notif.get("tsDevice"),
+        match.latency_sec,
+        match.score,
+        event.get("title"),
+        notif.get("title"),
+        event.get("msg"),
+        notif.get("text"),
+    )
 
 
 def _write_unmatched(path: Path, rows: List[Dict[str, Any]]) -> None:
@@ -113,10 +119,10 @@ def _write_unmatched(path: Path, rows: List[Dict[str, Any]]) -> None:
         return
     fieldnames = sorted({key for row in rows for key in row.keys()})
     with path.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
+        writer = csv.writer(handle)
+        writer.writerow(fieldnames)
+        # Missing keys become empty cells, as DictWriter's default restval did.
+        writer.writerows([row.get(key) for key in fieldnames] for row in rows)
 
 
 def _compute_metrics(events: List[Dict[str, Any]], matches: List[MatchResult]) -> Dict[str, Any]:
@@ -140,20 +146,39 @@ def _compute_metrics(events: List[Dict[str, Any]], matches: List[MatchResult]) -
 def _latency_stats(latencies: List[float]) -> Dict[str, float]:
     if not latencies:
         return {"mean": 0.0, "median": 0.0, "p90": 0.0, "p95": 0.0}
+    # One sort serves every quantile; statistics.median would sort again.
     latencies_sorted = sorted(latencies)
     return {
-        "mean": mean(latencies_sorted),
-        "median": median(latencies_sorted),
+        "mean": fmean(latencies_sorted),
+        "median": _percentile(latencies_sorted, 0.5),
         "p90": _percentile(latencies_sorted, 0.9),
         "p95": _percentile(latencies_sorted, 0.95),
     }
 
 
 def _percentile(values: List[float], percentile: float) -> float:
+    """Linearly interpolated percentile of sorted values (numpy's default method)."""
     if not values:
         return 0.0
-    index = int(round((len(values) - 1) * percentile))
-    return values[index]
+    position = (len(values) - 1) * percentile
+    lower = int(position)
+    fraction = position - lower
+    if not fraction:
+        return values[lower]
+    return values[lower] + (values[lower + 1] - values[lower]) * fraction
+
+
+def _count_by(rows: Iterable[Dict[str, Any]], key: str) -> Counter[str]:
+    """Row counts per str(row[key]), in first-appearance order.
+
+    Counter tallies the raw values in C; str() then runs once per distinct value
+    instead of once per row.
+    """
+    raw = Counter(row.get(key) for row in rows)
+    counts: Counter[str] = Counter()
+    for value, count in raw.items():
+        counts[str(value)] += count
+    return counts
 
 
 def _group_metrics(
@@ -161,21 +186,16 @@ def _group_metrics(
     matches: List[MatchResult],
     key: str,
 ) -> Dict[str, Any]:
-    totals = defaultdict(int)
-    matched = defaultdict(int)
-    for event in events:
-        totals[str(event.get(key))] += 1
-    for match in matches:
-        matched[str(match.event.get(key))] += 1
-
-    metrics = {}
-    for group, total in totals.items():
-        metrics[group] = {
+    totals = _count_by(events, key)
+    matched = _count_by((match.event for match in matches), key)
+    return {
+        group: {
             "total_events": total,
-            "matched_events": matched.get(group, 0),
-            "delivery_rate": matched.get(group, 0) / total if total else 0.0,
+            "matched_events": matched[group],
+            "delivery_rate": matched[group] / total,
         }
-    return metrics
+        for group, total in totals.items()
+    }
 
 
 def _write_metrics_csv(report_dir: Path, summary: Dict[str, Any]) -> None:
@@ -188,17 +208,12 @@ def _write_metrics_group(path: Path, group: Dict[str, Any]) -> None:
     fieldnames = ["group", "total_events", "matched_events", "delivery_rate"]
     ensure_dir(path.parent)
     with path.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
-        for name, data in group.items():
-            writer.writerow(
-                {
-                    "group": name,
-                    "total_events": data["total_events"],
-                    "matched_events": data["matched_events"],
-                    "delivery_rate": data["delivery_rate"],
-                }
-            )
+        writer = csv.writer(handle)
+        writer.writerow(fieldnames)
+        writer.writerows(
+            (name, data["total_events"], data["matched_events"], data["delivery_rate"])
+            for name, data in group.items()
+        )
 
 
 def _render_markdown(summary: Dict[str, Any]) -> str:
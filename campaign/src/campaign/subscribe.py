@@ -1,11 +1,10 @@
 from __future__ import annotations
 
-import json
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 from .hafas_gate import HafasGate
-from .io import ensure_dir, timestamped_run_dir, write_json, write_json_redacted
+from .io import ensure_dir, read_json, timestamped_run_dir, write_json, write_json_redacted
 from .models import Scenario
 
 
@@ -18,17 +17,27 @@ def run_subscribe(
     out_root: Path,
     hafas: HafasGate,
     save_logs: bool = True,
+    max_workers: int = 4,
 ) -> Path:
-    scenario_data = json.loads(scenario_path.read_text(encoding="utf-8"))
+    scenario_data = read_json(scenario_path)
     scenario = Scenario.from_dict(scenario_data)
     run_dir = timestamped_run_dir(out_root, scenario.campaignName)
-    write_json(run_dir / "scenario.json", scenario.to_dict())
+    write_json(run_dir / "scenario.json", scenario.to_dict(), pretty=True)
 
     subs_dir = run_dir / "subs"
     ensure_dir(subs_dir)
 
-    for index, item in enumerate(scenario.items, start=1):
-        response, corr_id, request_payload = hafas.subscr_create_con(item.__dict__)
+    results = hafas.subscr_create_con_many(
+        [item.to_dict() for item in scenario.items],
+        max_workers=max_workers,
+    )
+    failures: List[Tuple[str, Exception]] = []
+    for index, (item, result) in enumerate(zip(scenario.items, results), start=1):
+        if isinstance(result, Exception):
+            # Keep going: the remaining subscriptions may exist server-side and need a manifest.
+            failures.append((item.scenarioId, result))
+            continue
+        response, corr_id, request_payload = result
         subscr_id = _extract_subscr_id(response)
         subscr_dir = subs_dir / f"subscr_{subscr_id or f'unknown_{index}'}"
         ensure_dir(subscr_dir / "raw")
@@ -42,7 +51,7 @@ def run_subscribe(
             "hysteresisStored": _extract_hysteresis(response),
             "subscrId": subscr_id,
         }
-        write_json(subscr_dir / "manifest.json", manifest)
+        write_json(subscr_dir / "manifest.json", manifest, pretty=True)
         if save_logs:
             secrets = _secrets_map(hafas.config.aid, hafas.config.user_id, hafas.config.channel_id)
             write_json_redacted(subscr_dir / "raw/01_subscrcreate_req.json", request_payload, secrets)
@@ -50,6 +59,12 @@ def run_subscribe(
             (subscr_dir / "raw/01_subscrcreate_corrid.txt").write_text(corr_id, encoding="utf-8")
 
     ensure_dir(run_dir / "device")
+    if failures:
+        failed = ", ".join(scenario_id for scenario_id, _ in failures)
+        raise RuntimeError(
+            f"SubscrCreate failed for {len(failures)} of {len(scenario.items)} items ({failed}); "
+            f"the others were saved under {run_dir}"
+        ) from failures[0][1]
     return run_dir
 
 
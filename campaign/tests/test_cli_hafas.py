@@ -54,6 +54,31 @@ class HafasCliArgsTests(unittest.TestCase):
         self.assertEqual(payload["client"]["id"], config.client_id)
         self.assertNotEqual(payload["client"]["id"], config.channel_id)
 
+    def test_subscr_create_con_many_preserves_order(self) -> None:
+        config = HafasConfig(
+            base_url="https://example.test/gate",
+            aid="AID",
+            user_id="USER",
+            client_id="HAFAS",
+            channel_id="ANDROID-123",
+        )
+        hafas = HafasGate(config)
+
+        def fake_create(item: dict) -> tuple:
+            if item["ctxRecon"] == "ctx-3":
+                raise ValueError("boom")
+            return {"ctxRecon": item["ctxRecon"]}, "corr", {}
+
+        hafas.subscr_create_con = fake_create
+        items = [{"ctxRecon": f"ctx-{index}"} for index in range(10)]
+        results = list(hafas.subscr_create_con_many(items, max_workers=4))
+        self.assertEqual(len(results), len(items))
+        self.assertIsInstance(results[3], ValueError)
+        self.assertEqual(
+            [result[0]["ctxRecon"] for result in results if not isinstance(result, Exception)],
+            [item["ctxRecon"] for item in items if item["ctxRecon"] != "ctx-3"],
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,121 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import campaign.io
+from campaign.io import (
+    NdjsonWriter,
+    json_loads,
+    read_json,
+    read_ndjson,
+    redact_data,
+    redacted_json_dumps,
+    write_json_redacted,
+)
+
+
+class RedactionTests(unittest.TestCase):
+    def test_redact_data_replaces_secrets_in_nested_strings(self) -> None:
+        data = {
+            "auth": {"aid": "AID123"},
+            "req": [{"userId": "user-1", "note": "for user-1 via AID123"}],
+            "count": 3,
+        }
+        redacted = redact_data(data, {"AID123": "<AID>", "user-1": "<USER_ID>", "": "<EMPTY>"})
+        self.assertEqual(redacted["auth"]["aid"], "<AID>")
+        self.assertEqual(redacted["req"][0]["note"], "for <USER_ID> via <AID>")
+        self.assertEqual(redacted["count"], 3)
+        self.assertEqual(data["auth"]["aid"], "AID123")
+
+    def test_write_json_redacted_matches_tree_redaction(self) -> None:
+        data = {
+            "auth": {"aid": "AID\"123"},
+            "req": [{"userId": "usér-1", "note": "for usér-1 via AID\"123", "n": 123}],
+            "ok": True,
+        }
+        secrets = {"AID\"123": "<AID>", "usér-1": "<USER_ID>", "123": "<NUM>"}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "out.json"
+            write_json_redacted(path, data, {"AID\"123": "<AID>", "usér-1": "<USER_ID>"})
+            self.assertEqual(read_json(path), redact_data(data, {"AID\"123": "<AID>", "usér-1": "<USER_ID>"}))
+            # A digits-only secret must not touch the number 123.
+            write_json_redacted(path, data, secrets)
+            self.assertEqual(read_json(path), redact_data(data, secrets))
+
+    def test_redacted_json_dumps_ignores_matches_inside_escapes(self) -> None:
+        data = {"a": "x\nab", "b": "\x1fab", "c": "x\\nab"}
+        for secrets in ({"nab": "<AID>"}, {"1fab": "<AID>"}, {"nab": "<AID>", "ab": "<B>"}):
+            redacted = json_loads(redacted_json_dumps(data, secrets))
+            self.assertEqual(redacted, redact_data(data, secrets))
+        self.assertEqual(json_loads(redacted_json_dumps(data, {"nab": "<AID>"}))["c"], "x\\<AID>")
+
+    def test_secrets_in_object_keys_are_redacted_on_both_paths(self) -> None:
+        data = {"AID123": {"user-1": "AID123"}, "n": 5}
+        expected = {"<AID>": {"user-1": "<AID>"}, "n": 5}
+        # "5" can also match the number, which sends the record through the tree walk.
+        for secrets, tree_walk in (({"AID123": "<AID>"}, False), ({"AID123": "<AID>", "5": "<N>"}, True)):
+            with mock.patch.object(campaign.io, "_build_redactor", wraps=campaign.io._build_redactor) as build:
+                self.assertEqual(json_loads(redacted_json_dumps(data, secrets)), expected)
+            self.assertEqual(build.called, tree_walk)
+            self.assertEqual(redact_data(data, secrets), expected)
+
+
+class NdjsonWriterTests(unittest.TestCase):
+    def test_rows_are_appended_across_writes_and_visible_after_flush(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "sub" / "rows.ndjson"
+            path.parent.mkdir()
+            path.write_text('{"n": 0}\n', encoding="utf-8")
+            with NdjsonWriter() as writer:
+                writer.write(path, [{"n": 1}])
+                writer.write(path, [])
+                writer.write(path, [{"n": 2}, {"n": 3}])
+                writer.flush()
+                self.assertEqual([row["n"] for row in read_ndjson(path)], [0, 1, 2, 3])
+                writer.write(path, [{"n": 4}])
+            self.assertEqual([row["n"] for row in read_ndjson(path)], [0, 1, 2, 3, 4])
+
+    def test_maybe_flush_waits_for_the_interval_or_an_idle_period(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "rows.ndjson"
+            with NdjsonWriter(flush_interval=3600.0) as writer:
+                writer.write(path, [{"n": 1}])
+                writer.maybe_flush()
+                self.assertEqual(read_ndjson(path), [])
+                writer.maybe_flush(until=time.monotonic() + 7200.0)
+                self.assertEqual(read_ndjson(path), [{"n": 1}])
+            with NdjsonWriter() as writer:
+                writer.write(path, [{"n": 2}])
+                writer.maybe_flush()
+                self.assertEqual(len(read_ndjson(path)), 2)
+
+    def test_failed_flush_is_reported_and_keeps_rows_queued(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            blocker = Path(tmp) / "poll"
+            blocker.write_text("not a directory", encoding="utf-8")
+            path = blocker / "rows.ndjson"
+            errors = []
+            with NdjsonWriter(on_error=lambda failed, exc: errors.append(failed)) as writer:
+                writer.write(path, [{"n": 1}])
+                writer.flush()
+                self.assertEqual(errors, [path])
+                blocker.unlink()
+                writer.write(path, [{"n": 2}])
+            self.assertEqual(read_ndjson(path), [{"n": 1}, {"n": 2}])
+            with self.assertRaises(OSError):
+                with NdjsonWriter() as writer:
+                    writer.write(Path(tmp) / "poll" / "rows.ndjson" / "x", [{"n": 1}])
+
+    def test_many_queued_rows_keep_their_order(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "rows.ndjson"
+            with NdjsonWriter(buffer_size=1 << 30) as writer:
+                for n in range(2500):
+                    writer.write(path, [{"n": n}])
+            self.assertEqual([row["n"] for row in read_ndjson(path)], list(range(2500)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 
-from campaign.matching import similarity
+from campaign.matching import match_events_to_notifications, similarity
 
 
 class MatchingSimilarityTests(unittest.TestCase):
@@ -11,5 +11,25 @@ class MatchingSimilarityTests(unittest.TestCase):
         self.assertLess(similarity("Delay 5 min", "Platform change"), 80.0)
 
 
+class MatchEventsTests(unittest.TestCase):
+    def test_match_respects_window_and_consumes_notification(self) -> None:
+        events = [
+            {"title": "Delay", "msg": "Train delayed 5 min", "received": "2026-02-05T08:00:00+00:00"},
+            {"title": "Delay", "msg": "Train delayed 5 min", "received": "2026-02-05T08:01:00+00:00"},
+        ]
+        notifications = [
+            {"title": "Delay", "text": "Train delayed 5 min", "tsDevice": "2026-02-05T07:00:00+00:00"},
+            {"title": "Delay", "text": "Train delayed 5 min", "tsDevice": "2026-02-05T09:02:00+01:00"},
+        ]
+        matches, unmatched_events, unmatched_notifications = match_events_to_notifications(
+            events, notifications
+        )
+        self.assertEqual(len(matches), 1)
+        self.assertIs(matches[0].notification, notifications[1])
+        self.assertEqual(matches[0].latency_sec, 120.0)
+        self.assertEqual(unmatched_events, [events[1]])
+        self.assertEqual(unmatched_notifications, [notifications[0]])
+
+
 if __name__ == "__main__":
     unittest.main()
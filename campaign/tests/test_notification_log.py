@@ -3,7 +3,10 @@ import tempfile
 import unittest
 from pathlib import Path
 
-from campaign.notification_log import convert_notification_log_export
+from campaign.notification_log import convert_notification_log_export, ijson
+
+# A truncated export fails in whichever parser reads it.
+_PARSE_ERRORS = (ValueError,) if ijson is None else (ValueError, ijson.JSONError)
 
 
 class NotificationLogExportTests(unittest.TestCase):
@@ -61,6 +64,32 @@ class NotificationLogExportTests(unittest.TestCase):
         kinds = {json.loads(line)["kind"] for line in lines}
         self.assertEqual(kinds, {"posted", "removed"})
 
+    def test_raw_is_opt_in(self) -> None:
+        export_path = self._write_export()
+        out_path = self.base_path / "out.ndjson"
+        convert_notification_log_export(export_path, out_path)
+        record = json.loads(out_path.read_text(encoding="utf-8").splitlines()[0])
+        self.assertNotIn("raw", record)
+
+        convert_notification_log_export(export_path, out_path, include_raw=True)
+        record = json.loads(out_path.read_text(encoding="utf-8").splitlines()[0])
+        self.assertEqual(record["raw"]["nid"], 101)
+
+    def test_malformed_export_leaves_previous_output_untouched(self) -> None:
+        export_path = self._write_export()
+        out_path = self.base_path / "out.ndjson"
+        convert_notification_log_export(export_path, out_path)
+        previous = out_path.read_bytes()
+
+        # Truncated after the first posted[] item: the rows before the error must not land.
+        text = export_path.read_text(encoding="utf-8")
+        export_path.write_text(text[: text.index('"removed"')], encoding="utf-8")
+        for append in (False, True):
+            with self.assertRaises(_PARSE_ERRORS):
+                convert_notification_log_export(export_path, out_path, append=append)
+            self.assertEqual(out_path.read_bytes(), previous)
+        self.assertEqual(sorted(path.name for path in self.base_path.iterdir()), ["export.json", "out.ndjson"])
+
 
 if __name__ == "__main__":
     unittest.main()
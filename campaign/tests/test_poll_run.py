@@ -0,0 +1,192 @@
+import gzip
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Optional
+
+from campaign.hafas_gate import HafasConfig
+from campaign.io import read_ndjson, read_state, write_json
+from campaign.poll import _BATCH_EPSILON_SEC, _create_gzip, run_poll
+
+
+def _hafas_time(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class FakeGate:
+    """Stands in for HafasGate: answers SubscrDetails from canned connection times.
+
+    Every answer carries the rtEvents c1..c<max_events>; without connection times every
+    call is unexpected.
+    """
+
+    def __init__(
+        self,
+        dep: Optional[datetime] = None,
+        arr: Optional[datetime] = None,
+        *,
+        max_events: int = 1,
+        fail_on: Optional[dict] = None,
+        first_batch: Optional[threading.Barrier] = None,
+    ) -> None:
+        self.config = HafasConfig(
+            base_url="https://example.test/gate",
+            aid="AID",
+            user_id="USER",
+            client_id="HAFAS",
+            channel_id="ANDROID-123",
+        )
+        self.dep = dep
+        self.arr = arr
+        self.max_events = max_events
+        self.fail_on = fail_on or {}
+        self.first_batch = first_batch
+        # (subscr_id, monotonic time, succeeded) per call, in call order.
+        self.calls: list = []
+        self._lock = threading.Lock()
+
+    def calls_for(self, subscr_id: int) -> list:
+        return [call for call in self.calls if call[0] == subscr_id]
+
+    def subscr_details(self, subscr_id: int) -> tuple:
+        if self.dep is None:
+            self.calls.append((subscr_id, time.monotonic(), False))
+            raise AssertionError(f"unexpected SubscrDetails for {subscr_id}")
+        with self._lock:
+            attempt = len(self.calls_for(subscr_id)) + 1
+            failed = self.fail_on.get(subscr_id) == attempt
+            self.calls.append((subscr_id, time.monotonic(), not failed))
+        if attempt == 1 and self.first_batch is not None:
+            # Only returns once every subscription is being fetched at the same time.
+            self.first_batch.wait()
+        if failed:
+            raise ConnectionError("gateway timeout")
+        events = [
+            {"changeId": f"c{n}", "changeType": "DELAY", "msg": f"delay {n}"} for n in range(1, self.max_events + 1)
+        ]
+        details = {
+            "svcResL": [
+                {
+                    "res": {
+                        "details": {
+                            "conSubscr": {
+                                "connectionInfo": [
+                                    {"departureTime": _hafas_time(self.dep), "arrivalTime": _hafas_time(self.arr)}
+                                ]
+                            },
+                            "eventHistory": {"rtEvents": events},
+                        }
+                    }
+                }
+            ]
+        }
+        return details, f"corr-{subscr_id}-{attempt}", {"req": {"subscrId": subscr_id}}
+
+
+def _write_subscription(run_dir: Path, subscr_id: int, state: dict | None = None) -> Path:
+    subscr_dir = run_dir / "subs" / f"subscr_{subscr_id}"
+    write_json(subscr_dir / "manifest.json", {"subscrId": subscr_id, "scenarioId": f"scen{subscr_id}"})
+    if state is not None:
+        write_json(subscr_dir / "poll" / "state.json", state)
+    return subscr_dir
+
+
+class RunPollTests(unittest.TestCase):
+    def test_restart_skips_subscriptions_already_done(self) -> None:
+        later = (datetime.now(timezone.utc) + timedelta(minutes=10)).isoformat()
+        with TemporaryDirectory() as tmpdir:
+            run_dir = Path(tmpdir)
+            for subscr_id in (1, 2):
+                _write_subscription(run_dir, subscr_id, {"pollCount": 5, "done": True, "next_due_utc": later})
+            gate = FakeGate()
+            started = time.monotonic()
+            run_poll(run_dir, gate, poll_sec=60, pre_window_min=10, post_window_min=30, max_runtime_min=1)
+            self.assertLess(time.monotonic() - started, 5.0)
+            self.assertEqual(gate.calls, [])
+
+    def test_batches_back_off_finish_and_resume_across_runs(self) -> None:
+        subscr_ids = (1, 2, 3)
+        now = datetime.now(timezone.utc)
+        with TemporaryDirectory() as tmpdir:
+            run_dir = Path(tmpdir)
+            # An earlier run left the same next poll for all three: they come due together.
+            for subscr_id in subscr_ids:
+                _write_subscription(
+                    run_dir, subscr_id, {"pollCount": 2, "next_due_utc": (now + timedelta(minutes=5)).isoformat()}
+                )
+
+            # First run: inside the window, only c1 ever shows up, stopped by the deadline.
+            first = FakeGate(
+                now - timedelta(minutes=5),
+                now + timedelta(hours=1),
+                fail_on={2: 2},
+                first_batch=threading.Barrier(len(subscr_ids), timeout=5),
+            )
+            run_poll(run_dir, first, poll_sec=0.1, pre_window_min=10, post_window_min=30, max_runtime_min=0.02)
+
+            self.assertEqual({call[0] for call in first.calls[:3]}, set(subscr_ids))
+            polls_after_first = {}
+            for subscr_id in subscr_ids:
+                poll_dir = run_dir / "subs" / f"subscr_{subscr_id}" / "poll"
+                answered = sum(1 for call in first.calls_for(subscr_id) if call[2])
+                self.assertGreaterEqual(answered, 2)
+                state = read_state(poll_dir / "state.json")
+                self.assertEqual(state["pollCount"], 2 + answered)
+                self.assertFalse(state["done"])
+                polls_after_first[subscr_id] = state["pollCount"]
+                self.assertEqual([row["changeId"] for row in read_ndjson(poll_dir / "rt_events.ndjson")], ["c1"])
+                reasons = [row["done_reason"] for row in read_ndjson(poll_dir / "poll_log.ndjson")]
+                self.assertEqual(reasons.count("network_error_backoff"), 1 if subscr_id == 2 else 0)
+            # The failed poll is retried after twice the poll interval (less the batching slack),
+            # not at the next tick.
+            calls = first.calls_for(2)
+            self.assertFalse(calls[1][2])
+            self.assertGreaterEqual(calls[2][1] - calls[1][1], 0.2 - _BATCH_EPSILON_SEC)
+
+            # Second run over the same state: the connection is over and c2 is new.
+            second = FakeGate(now - timedelta(hours=3), now - timedelta(hours=2), max_events=2)
+            started = time.monotonic()
+            run_poll(
+                run_dir,
+                second,
+                poll_sec=0.1,
+                pre_window_min=10,
+                post_window_min=30,
+                idle_grace_min=0,
+                max_runtime_min=1,
+            )
+            self.assertLess(time.monotonic() - started, 10.0)
+            for subscr_id in subscr_ids:
+                poll_dir = run_dir / "subs" / f"subscr_{subscr_id}" / "poll"
+                # c2 counts as activity; the next poll brings nothing new and finishes it.
+                self.assertEqual(len(second.calls_for(subscr_id)), 2)
+                state = read_state(poll_dir / "state.json")
+                self.assertTrue(state["done"])
+                self.assertEqual(state["pollCount"], polls_after_first[subscr_id] + 2)
+                rows = read_ndjson(poll_dir / "rt_events.ndjson")
+                self.assertEqual([row["changeId"] for row in rows], ["c1", "c2"])
+                self.assertEqual(read_ndjson(poll_dir / "poll_log.ndjson")[-1]["done_reason"], "idle_grace_elapsed")
+
+    def test_raw_logs_never_append_to_an_existing_file(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "subscrdetails_20250101T000000Z.ndjson.gz"
+            for text in (b"first\n", b"second\n", b"third\n"):
+                with _create_gzip(path) as handle:
+                    handle.write(text)
+            names = sorted(child.name for child in Path(tmpdir).iterdir())
+            self.assertEqual(
+                names,
+                [
+                    "subscrdetails_20250101T000000Z-2.ndjson.gz",
+                    "subscrdetails_20250101T000000Z-3.ndjson.gz",
+                    "subscrdetails_20250101T000000Z.ndjson.gz",
+                ],
+            )
+            self.assertEqual(gzip.decompress(path.read_bytes()), b"first\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,27 @@
+import json
 import unittest
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest import mock
 
-from campaign.io import update_state, write_json
-from campaign.poll import _compute_planned_end
+import campaign.io
+from campaign.io import (
+    append_ndjson,
+    append_state_delta,
+    compact_state,
+    ensure_state,
+    read_state,
+    update_state,
+    write_json,
+)
+from campaign.poll import (
+    _compute_planned_end,
+    _event_key,
+    _load_seen_keys,
+    _new_event_rows,
+    _persisted_next_due_in,
+)
 
 
 class PollingStopTests(unittest.TestCase):
@@ -66,9 +83,102 @@ class PollingStopTests(unittest.TestCase):
                     "customField": "keep",
                 },
             )
-            update_state(state_path, seen_keys=["b"], poll_count=2)
-            state = state_path.read_text(encoding="utf-8")
-            self.assertIn('"customField": "keep"', state)
+            update_state(state_path, poll_count=2)
+            state = json.loads(state_path.read_text(encoding="utf-8"))
+            self.assertEqual(state["customField"], "keep")
+            self.assertEqual(state["pollCount"], 2)
+            self.assertNotIn("seenKeys", state)
+
+    def test_state_deltas_are_replayed_and_compacted(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            state_path = Path(tmpdir) / "state.json"
+            write_json(state_path, {"pollCount": 1, "done": False, "customField": "keep"})
+            append_state_delta(state_path, poll_count=2, last_activity_utc="2025-01-01T00:10:00Z")
+            append_state_delta(state_path, poll_count=3)
+            with state_path.with_suffix(".log").open("a", encoding="utf-8") as handle:
+                handle.write('{"pollCount": 9')  # torn by an interrupted append
+            append_state_delta(state_path, poll_count=4, done=True)
+            append_state_delta(state_path, poll_count=5)
+
+            state = ensure_state(state_path)
+            self.assertEqual(state["pollCount"], 5)
+            self.assertFalse(state["done"])  # lost with the torn line it was appended to
+            self.assertEqual(state["lastActivityUtc"], "2025-01-01T00:10:00Z")
+            self.assertEqual(state["customField"], "keep")
+
+            compact_state(state_path)
+            self.assertFalse(state_path.with_suffix(".log").exists())
+            self.assertEqual(json.loads(state_path.read_text(encoding="utf-8")), state)
+
+            # An in-memory copy kept in step with the writes matches what is on disk.
+            state.update(append_state_delta(state_path, poll_count=6))
+            self.assertEqual(ensure_state(state_path), state)
+            state = update_state(state_path, poll_count=7, current=state)
+            self.assertEqual(json.loads(state_path.read_text(encoding="utf-8")), state)
+            self.assertEqual(state["pollCount"], 7)
+
+    def test_seen_keys_skip_a_torn_last_line(self) -> None:
+        with TemporaryDirectory() as tmpdir:
+            seen_path = Path(tmpdir) / "seen_keys.ndjson"
+            seen_path.write_bytes(b'{"k":"a"}\n{"k":"b')
+            self.assertEqual(_load_seen_keys(Path(tmpdir), {}), {"a"})
+            append_ndjson(seen_path, [{"k": "c"}])
+            self.assertEqual(_load_seen_keys(Path(tmpdir), {"seenKeys": ["d"]}), {"a", "c", "d"})
+            self.assertEqual(_load_seen_keys(Path(tmpdir), {}), {"a", "c", "d"})
+
+    def test_persisted_next_due_resumes_only_future_polls(self) -> None:
+        now = datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc)
+        with TemporaryDirectory() as tmpdir:
+            state_path = Path(tmpdir) / "state.json"
+            self.assertIsNone(_persisted_next_due_in(read_state(state_path), now, 900.0))
+            write_json(state_path, {"pollCount": 3})
+            append_state_delta(state_path, poll_count=4, extra_fields={"next_due_utc": "2025-01-01T10:01:30+00:00"})
+            state = read_state(state_path)
+            self.assertEqual(_persisted_next_due_in(state, now, 900.0), 90.0)
+            self.assertEqual(_persisted_next_due_in(state, now, 60.0), 60.0)
+            self.assertIsNone(_persisted_next_due_in(state, now + timedelta(minutes=5), 900.0))
+
+    def test_event_key_ignores_field_order(self) -> None:
+        event = {"changeType": "DELAY", "msg": "late", "nested": {"a": 1, "b": [1, 2]}}
+        reordered = {"nested": {"b": [1, 2], "a": 1}, "msg": "late", "changeType": "DELAY"}
+        self.assertEqual(_event_key(event), _event_key(reordered))
+        self.assertNotEqual(_event_key(event), _event_key({**event, "msg": "later"}))
+        self.assertEqual(_event_key({"changeId": 42, "msg": "x"}), "42")
+
+    def test_event_key_hash_is_stable_across_runs(self) -> None:
+        # Keys are persisted in seen_keys.ndjson: a resumed poll must derive the same value,
+        # whether or not orjson is installed.
+        event = {"changeType": "DELAY", "msg": "late", "date": "20250101"}
+        floats = {"changeType": "DELAY", "delay": [1e-05, 1e20, 0.5], "id": 2**70}
+        keys = (_event_key(event), _event_key(floats))
+        # sha1 over json.dumps(sort_keys=True, ensure_ascii=False), as the first releases wrote it.
+        self.assertEqual(keys[0], "65863054cf4cf9c96ad66bb6b2b4369b06d0df7e")
+        with mock.patch.object(campaign.io, "orjson", None):
+            self.assertEqual((_event_key(event), _event_key(floats)), keys)
+        # Fields outside the usual rtEvent set still tell events apart.
+        self.assertNotEqual(_event_key({**event, "extra": 1}), _event_key(event))
+
+    def test_resume_from_legacy_seen_keys_skips_known_events(self) -> None:
+        events = [{"changeType": "DELAY", "msg": "late"}, {"changeId": "c1"}, {"changeType": "NEW"}]
+        with TemporaryDirectory() as tmpdir:
+            poll_dir = Path(tmpdir)
+            # state.json as the first releases wrote it: sha1 keys in a seenKeys list.
+            legacy_key = "fa691b2bae393f472c1da479ed5eaed71caef339"
+            write_json(poll_dir / "state.json", {"pollCount": 3, "seenKeys": ["c1", legacy_key]})
+            state = ensure_state(poll_dir / "state.json")
+            seen = _load_seen_keys(poll_dir, state)
+            rows = _new_event_rows(events, seen, "scen", 7, "corr", "t", False)
+            self.assertEqual([row["changeType"] for row in rows], ["NEW"])
+
+    def test_new_event_rows_skip_seen_and_repeated_events(self) -> None:
+        seen = {"c1"}
+        events = [{"changeId": "c1"}, {"changeId": "c2", "msg": "a"}, {"changeId": "c2", "msg": "b"}, {"msg": "x"}]
+        rows = _new_event_rows(events, seen, "scen", 7, "corr", "2025-01-01T00:00:00+00:00", False)
+        self.assertEqual([row["changeId"] for row in rows], ["c2", None])
+        self.assertEqual(rows[0]["msg"], "a")
+        self.assertEqual(seen, {"c1", "c2", _event_key({"msg": "x"})})
+        self.assertNotIn("raw", rows[0])
+        self.assertEqual(_new_event_rows(events, seen, "scen", 7, "corr", "t", False), [])
 
 
 if __name__ == "__main__":